@@ -25,6 +25,7 @@ from pricing_config import (
 
 # Импорт API
 from fourpvs_api import FourVPSAPI, get_country_name, get_flag_emoji
+from rent_server_4vps import _get_api
 
 logger = logging.getLogger(__name__)
 
@@ -99,7 +100,7 @@ async def update_4vps_availability() -> Dict[int, bool]:
     availability = {}
     
     try:
-        api = FourVPSAPI(FOURVPS_API_TOKEN)
+        api = await _get_api()
         
         # Получаем список всех дата-центров
         datacenters = await api.get_datacenters()
@@ -223,7 +224,7 @@ async def load_all_locations(protocol: str) -> Dict[str, List[Dict]]:
         # 2. Загрузка локаций из 4VPS (через API)
         if FOURVPS_API_TOKEN:
             try:
-                api = FourVPSAPI(FOURVPS_API_TOKEN)
+                api = await _get_api()
                 datacenters = await api.get_datacenters()
                 
                 # Получаем статусы доступности (если кэш уже существует)
@@ -496,7 +497,7 @@ async def show_tariff_selection(update: Update, context: ContextTypes.DEFAULT_TY
     if location_key.startswith('4vps_'):
         # Локация через API - загружаем информацию
         try:
-            api = FourVPSAPI(FOURVPS_API_TOKEN)
+            api = await _get_api()
             datacenters = await api.get_datacenters()
             dc_id = int(location_key.replace('4vps_', ''))
             location = next((dc for dc in datacenters if dc['id'] == dc_id), None)
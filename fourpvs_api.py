@@ -17,6 +17,10 @@ API_BASE_URL = "https://4vps.su/api"
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # секунды
 TIMEOUT = 30  # секунды
+# Лимиты пула соединений общей сессии
+POOL_LIMIT = 40
+POOL_LIMIT_PER_HOST = 20
+KEEPALIVE_TIMEOUT = 60  # секунды
 
 
 class FourVPSAPI:
@@ -37,22 +41,72 @@ class FourVPSAPI:
         # Можно раскомментировать, если нужно отключить проверку сертификата
         # self.ssl_context.check_hostname = False
         # self.ssl_context.verify_mode = ssl.CERT_NONE
+        # Общая сессия с пулом keep-alive соединений: создается лениво в
+        # текущем event loop и переиспользуется всеми запросами клиента
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
     
-    async def _get(self, endpoint: str) -> Dict:
-        """Выполнить GET запрос к API с повторными попытками"""
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Вернуть общую сессию, пересоздав её при смене event loop"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._discard_session()
+            connector = aiohttp.TCPConnector(
+                ssl=self.ssl_context,
+                limit=POOL_LIMIT,
+                limit_per_host=POOL_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=TIMEOUT, sock_connect=5),
+                connector=connector,
+                headers=self.headers,
+            )
+            self._session_loop = loop
+        return self._session
+    
+    def _discard_session(self) -> None:
+        """Закрыть сессию, привязанную к другому event loop, не дожидаясь его"""
+        session, loop = self._session, self._session_loop
+        self._session = None
+        self._session_loop = None
+        if session is None or session.closed or loop is None:
+            return
+        if loop.is_running():
+            # Закрываем в том же loop, где сессия была создана
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        try:
+            # Loop остановлен: закрываем транспорты синхронно через коннектор
+            session.connector.close()
+        except RuntimeError:
+            # Loop уже закрыт - сокеты освобождены вместе с ним
+            pass
+        session.detach()
+    
+    async def close(self) -> None:
+        """Закрыть общую сессию (вызывать при завершении работы)"""
+        session, self._session = self._session, None
+        self._session_loop = None
+        if session is not None and not session.closed:
+            await session.close()
+    
+    async def _get(self, endpoint: str, timeout: Optional[float] = None) -> Dict:
+        """Выполнить GET запрос к API с повторными попытками
+
+        timeout (сек) переопределяет общий таймаут сессии для одного запроса.
+        """
         url = f"{API_BASE_URL}/{endpoint}"
+        req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
         
         for attempt in range(MAX_RETRIES):
             try:
-                timeout = aiohttp.ClientTimeout(total=TIMEOUT)
-                connector = aiohttp.TCPConnector(ssl=self.ssl_context)
-                
-                async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
-                    async with session.get(url, headers=self.headers) as response:
-                        data = await response.json()
-                        if data.get('error'):
-                            logger.error(f"API error: {data.get('errorMessage')}")
-                        return data
+                session = self._get_session()
+                async with session.get(url, timeout=req_timeout) as response:
+                    data = await response.json()
+                    if data.get('error'):
+                        logger.error(f"API error: {data.get('errorMessage')}")
+                    return data
                         
             except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
                 logger.warning(f"API request attempt {attempt + 1}/{MAX_RETRIES} failed: {e}")
@@ -73,15 +127,12 @@ class FourVPSAPI:
         
         for attempt in range(MAX_RETRIES):
             try:
-                timeout = aiohttp.ClientTimeout(total=TIMEOUT)
-                connector = aiohttp.TCPConnector(ssl=self.ssl_context)
-                
-                async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
-                    async with session.post(url, headers=self.headers, json=payload) as response:
-                        data = await response.json()
-                        if data.get('error'):
-                            logger.error(f"API error: {data.get('errorMessage')}")
-                        return data
+                session = self._get_session()
+                async with session.post(url, json=payload) as response:
+                    data = await response.json()
+                    if data.get('error'):
+                        logger.error(f"API error: {data.get('errorMessage')}")
+                    return data
                         
             except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
                 logger.warning(f"API POST attempt {attempt + 1}/{MAX_RETRIES} failed: {e}")
@@ -272,17 +323,18 @@ class FourVPSAPI:
             return result['data'].get('serverlist', [])
         return []
     
-    async def get_server_info(self, server_id: int) -> Optional[Dict]:
+    async def get_server_info(self, server_id: int, timeout: Optional[float] = None) -> Optional[Dict]:
         """
         Получить информацию о сервере
         
         Args:
             server_id: ID сервера
+            timeout: Таймаут запроса в секундах (по умолчанию TIMEOUT)
             
         Returns:
             Полная информация о сервере
         """
-        result = await self._get(f"getServerInfo/{server_id}")
+        result = await self._get(f"getServerInfo/{server_id}", timeout=timeout)
         if not result.get('error') and result.get('data'):
             return result['data']
         return None
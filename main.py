@@ -1,9 +1,12 @@
 import asyncio
+import atexit
 import calendar
 from datetime import timedelta
 import json
 import logging
+import logging.handlers
 import os
+import queue
 import html
 import re
 import secrets
@@ -28,7 +31,14 @@ from telegram.ext import (Application, ApplicationBuilder,
                           CallbackQueryHandler, CommandHandler, ContextTypes,
                           MessageHandler, PreCheckoutQueryHandler, filters)
 
-logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+# Log records go through a queue; a background listener thread does the stream I/O
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -672,6 +682,7 @@ async def init_db():
         await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_peers_order ON peers(order_id)")
         await db.execute("CREATE INDEX IF NOT EXISTS idx_deposits_status ON deposits(status)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_deposits_user ON deposits(user_id)")
         await db.commit()
 
     os.makedirs(ARTIFACTS_DIR, exist_ok=True)
@@ -6634,6 +6645,24 @@ def main():
 
     app.post_init = _post_init
 
+    async def _post_shutdown(app_: Application) -> None:
+        try:
+            import rent_server_4vps
+            await rent_server_4vps.aclose_api()
+        except Exception:
+            logger.warning("Failed to close 4VPS API client", exc_info=True)
+        try:
+            await support_mod.close_db()
+        except Exception:
+            logger.warning("Failed to close support DB connection", exc_info=True)
+        try:
+            import r99
+            await r99.close_db()
+        except Exception:
+            logger.warning("Failed to close r99 DB connection", exc_info=True)
+
+    app.post_shutdown = _post_shutdown
+
     logger.info("Bot started")
     
     # Кэши будут загружены автоматически при первом запросе
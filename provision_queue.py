@@ -1,5 +1,4 @@
 import os
-import sys
 import asyncio
 from dataclasses import dataclass
 from typing import Optional
@@ -7,8 +6,12 @@ from typing import Optional
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application
 
+import provision_xray
+
 # This module provides a simple in-memory FIFO queue for provisioning tasks
 # to avoid concurrent provisioning collisions. It serializes tasks one-by-one.
+# Xray orders are provisioned in-process by the long-lived worker instead of
+# spawning a fresh interpreter per order.
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'bot.db')
@@ -23,25 +26,24 @@ _queue: asyncio.Queue[ProvisionTask] = asyncio.Queue()
 _busy: bool = False
 
 async def _provision_xray(order_id: int) -> tuple[int, str]:
-    """Run provision_xray.py for a given order id. Returns (rc, error_text)."""
-    prov_path = os.path.join(BASE_DIR, 'provision_xray.py')
-    if not os.path.exists(prov_path):
-        return 2, 'provision_xray.py not found'
-
-    def _run():
-        import subprocess
-        return subprocess.run(
-            [sys.executable, prov_path, '--order-id', str(order_id), '--db', DB_PATH],
-            cwd=BASE_DIR,
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
-
-    res = await asyncio.to_thread(_run)
-    if res.returncode != 0:
-        err = res.stderr or res.stdout or 'Unknown error'
-        return res.returncode, err[-2000:]
+    """Provision an xray order in this process via provision_xray.provision_order. Returns (rc, error_text)."""
+    try:
+        res = await asyncio.wait_for(provision_xray.provision_order(DB_PATH, order_id), timeout=600)
+    except asyncio.TimeoutError:
+        # The cancelled run never reached a terminal status; record the failure
+        # like the subprocess path did, so the order does not stay 'provisioning'
+        try:
+            db = await provision_xray._open_db(DB_PATH)
+            try:
+                await provision_xray.update_order_status(db, order_id, 'provision_failed')
+            finally:
+                await db.close()
+        except Exception:
+            pass
+        return 5, 'Provisioning timed out'
+    if res['rc'] != 0:
+        err = res.get('stderr') or res.get('out') or 'Unknown error'
+        return res['rc'], err[-2000:]
     return 0, ''
 
 async def _process_task(app: Application, task: ProvisionTask) -> None:
@@ -1,7 +1,7 @@
 import os
-import sys
 import asyncio
 import secrets
+from contextlib import asynccontextmanager
 from typing import Optional, Tuple
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
@@ -13,6 +13,50 @@ DB_PATH = os.path.join(BASE_DIR, 'bot.db')
 R99_TXT = os.path.join(BASE_DIR, '99.txt')
 R99_PRICE_RUB = float(os.getenv('R99_PRICE_RUB', '199'))
 RUB_USD_RATE = float(os.getenv('R99_RUB_USD_RATE', '100'))  # 100 RUB ~= 1 USD by default
+# provision_queue runs provision_xray in this process with its own connections: WAL + busy_timeout absorb lock contention between them
+DB_PRAGMAS = "PRAGMA journal_mode=WAL; PRAGMA busy_timeout=30000; PRAGMA synchronous=NORMAL;"
+# SQLite has a single writer anyway; serializing writes in-process avoids piling up on busy_timeout
+_WRITE_LOCK = asyncio.Lock()
+
+
+async def _open_db(path: str) -> aiosqlite.Connection:
+    db = await aiosqlite.connect(path, timeout=30)
+    await db.executescript(DB_PRAGMAS)
+    return db
+
+
+# One connection for the whole bot process instead of reopening bot.db per callback
+_DB: Optional[aiosqlite.Connection] = None
+_DB_LOCK = asyncio.Lock()
+
+
+async def _db() -> aiosqlite.Connection:
+    global _DB
+    if _DB is None:
+        async with _DB_LOCK:
+            if _DB is None:
+                _DB = await _open_db(DB_PATH)
+    return _DB
+
+
+async def close_db() -> None:
+    """Close the shared connection; its aiosqlite worker thread would otherwise keep the process alive."""
+    global _DB
+    db, _DB = _DB, None
+    if db is not None:
+        await db.close()
+
+
+@asynccontextmanager
+async def _write_tx():
+    """Shared connection under _WRITE_LOCK; an unfinished transaction is rolled back on error."""
+    async with _WRITE_LOCK:
+        db = await _db()
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
 
 
 def _gen_public_id(n: int = 8) -> str:
@@ -20,24 +64,21 @@ def _gen_public_id(n: int = 8) -> str:
     return ''.join(secrets.choice(alphabet) for _ in range(n))
 
 
-async def _get_balance(uid: int) -> float:
-    async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-        cur = await db.execute("SELECT balance FROM users WHERE user_id=?", (uid,))
-        row = await cur.fetchone()
-        return float(row[0]) if row and row[0] is not None else 0.0
-
-
-async def _update_balance(uid: int, delta: float) -> None:
-    async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-        await db.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (uid,))
-        await db.execute("UPDATE users SET balance = IFNULL(balance,0) + ? WHERE user_id=?", (delta, uid))
-        await db.commit()
+# Parsed 99.txt keyed by (mtime_ns, size); the file changes rarely
+_r99_cache = {"key": None, "val": None}
 
 
 def _read_r99_server() -> Optional[Tuple[str, str, str, int]]:
     """Read first line from 99.txt as: host user pass [port]."""
-    if not os.path.exists(R99_TXT):
+    try:
+        st = os.stat(R99_TXT)
+    except OSError:
+        _r99_cache["key"] = _r99_cache["val"] = None
         return None
+    key = (st.st_mtime_ns, st.st_size)
+    if key == _r99_cache["key"]:
+        return _r99_cache["val"]
+    val = None
     try:
         with open(R99_TXT, 'r', encoding='utf-8') as f:
             for line in f:
@@ -49,10 +90,12 @@ def _read_r99_server() -> Optional[Tuple[str, str, str, int]]:
                     continue
                 host, user, pwd = parts[0], parts[1], parts[2]
                 port = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else 22
-                return host, user, pwd, port
+                val = (host, user, pwd, port)
+                break
     except Exception:
         return None
-    return None
+    _r99_cache["key"], _r99_cache["val"] = key, val
+    return val
 
 
 async def handle_r99_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: Optional[str]) -> bool:
@@ -82,43 +125,10 @@ async def handle_r99_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     return True
 
 
-async def _provision_xray(order_id: int) -> Tuple[int, str]:
-    """Run provision_xray.py for a given order id. Returns (rc, err)."""
-    prov_path = os.path.join(BASE_DIR, 'provision_xray.py')
-    if not os.path.exists(prov_path):
-        return 2, 'provision_xray.py not found'
-
-    def _run():
-        import subprocess
-        return subprocess.run(
-            [sys.executable, prov_path, '--order-id', str(order_id), '--db', DB_PATH],
-            cwd=BASE_DIR,
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
-
-    res = await asyncio.to_thread(_run)
-    if res.returncode != 0:
-        err = res.stderr or res.stdout or 'Unknown error'
-        return res.returncode, err[-2000:]
-    return 0, ''
-
-
 async def _handle_buy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     uid = update.effective_user.id
     # Price in USD (deduct from balance)
     price_usd = round(R99_PRICE_RUB / RUB_USD_RATE, 2)
-    balance = await _get_balance(uid)
-    if balance < price_usd:
-        msg = (
-            f"Недостаточно средств. Цена: {price_usd:.2f} $.\n"
-            f"Ваш баланс: {balance:.2f} $. Пополните и повторите."
-        )
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("💰 Пополнить", callback_data="menu:topup")], [InlineKeyboardButton("⬅️ Назад", callback_data="menu:r99")]])
-        await update.callback_query.edit_message_text(msg, reply_markup=kb)
-        return True
-
     server = _read_r99_server()
     if not server:
         await update.callback_query.edit_message_text(
@@ -128,26 +138,50 @@ async def _handle_buy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> boo
         return True
     host, user, pwd, port = server
 
-    # Deduct funds and create order
-    await _update_balance(uid, -price_usd)
-
-    public_id = _gen_public_id()
-    async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-        # Ensure unique public_id
-        for _ in range(5):
-            cur = await db.execute("SELECT 1 FROM orders WHERE public_id=?", (public_id,))
-            if not await cur.fetchone():
-                break
-            public_id = _gen_public_id()
+    # Deduct funds and create order in one write transaction
+    order_id = None
+    balance = 0.0
+    async with _write_tx() as db:
+        # Take the write lock upfront so a concurrent writer fails at BEGIN, not halfway through
+        await db.execute("BEGIN IMMEDIATE")
+        # Check and deduct in one statement: no rows changed means insufficient funds
         cur = await db.execute(
-            """
-            INSERT INTO orders (user_id, public_id, country, tariff_label, price_usd, months, discount, config_count, status, protocol, server_host, server_user, server_pass, ssh_port)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'provisioning', 'xray', ?, ?, ?, ?)
-            """,
-            (uid, public_id, 'R99', f"VPN {int(R99_PRICE_RUB)}₽", float(price_usd), 1, 0.0, 1, host, user, pwd, port)
+            "UPDATE users SET balance = balance - ? WHERE user_id=? AND balance >= ?",
+            (price_usd, uid, price_usd)
+        )
+        if cur.rowcount == 1:
+            # public_id is UNIQUE: retry with a fresh id only if the insert was skipped on conflict
+            for _ in range(5):
+                rows = await db.execute_fetchall(
+                    """
+                    INSERT INTO orders (user_id, public_id, country, tariff_label, price_usd, months, discount, config_count, status, protocol, server_host, server_user, server_pass, ssh_port)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'provisioning', 'xray', ?, ?, ?, ?)
+                    ON CONFLICT(public_id) DO NOTHING
+                    RETURNING id
+                    """,
+                    (uid, _gen_public_id(), 'R99', f"VPN {int(R99_PRICE_RUB)}₽", float(price_usd), 1, 0.0, 1, host, user, pwd, port)
+                )
+                if rows:
+                    order_id = rows[0][0]
+                    break
+            if order_id is None:
+                await db.rollback()
+                raise RuntimeError('r99: failed to allocate a unique public_id')
+            await db.commit()
+        else:
+            cur = await db.execute("SELECT balance FROM users WHERE user_id=?", (uid,))
+            row = await cur.fetchone()
+            balance = float(row[0]) if row and row[0] is not None else 0.0
+            await db.rollback()
+
+    if order_id is None:
+        msg = (
+            f"Недостаточно средств. Цена: {price_usd:.2f} $.\n"
+            f"Ваш баланс: {balance:.2f} $. Пополните и повторите."
         )
-        await db.commit()
-        order_id = cur.lastrowid
+        kb = InlineKeyboardMarkup([[InlineKeyboardButton("💰 Пополнить", callback_data="menu:topup")], [InlineKeyboardButton("⬅️ Назад", callback_data="menu:r99")]])
+        await update.callback_query.edit_message_text(msg, reply_markup=kb)
+        return True
 
     # Inform user and enqueue provisioning task
     try:
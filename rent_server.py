@@ -7,15 +7,33 @@
 """
 
 import argparse
+import asyncio
 import base64
+import bisect
+import functools
 import json
+import logging
 import os
+import random
 import sys
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional, Literal
 
+import aiohttp
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# orjson парсит bytes напрямую, без промежуточного str; json.loads тоже принимает bytes
+_loads = orjson.loads if orjson else json.loads
 
 # Загрузка переменных окружения
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,9 +41,45 @@ ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, os.pardir))
 load_dotenv(os.path.join(ROOT_DIR, '.env'))
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+logger = logging.getLogger('ruvds')
+# RUVDS_LOG=WARNING глушит болтовню опроса: сообщения даже не форматируются
+_log_level = os.getenv("RUVDS_LOG", "INFO").upper()
+# Неизвестное имя уровня не должно ронять импорт модуля - откатываемся на INFO
+logger.setLevel(_log_level if isinstance(logging.getLevelName(_log_level), int) else logging.INFO)
+
 API_BASE_URL = "https://api.ruvds.com/v2"
 API_TOKEN = os.getenv("RUVDS_API_TOKEN", "")
 
+# Таймауты (connect, read): мёртвый эндпоинт отваливается за 5с, а не за 30с.
+# Ответы на опросы статуса короткие, поэтому там и чтение короче.
+_TIMEOUT = (5.0, 30.0)
+_POLL_TIMEOUT = (5.0, 15.0)
+
+# Фоновый пул для удаления серверов без ожидания ответа API
+_DELETE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ruvds-delete")
+
+# Файловый кэш справочников RUVDS (ДЦ, тарифы, ОС меняются раз в дни)
+CACHE_DIR = os.getenv("RUVDS_CACHE_DIR", os.path.join(BASE_DIR, "artifacts", "ruvds_cache"))
+CACHE_TTL_DATACENTERS = 3600
+CACHE_TTL_TARIFFS = 600
+CACHE_TTL_OS = 3600
+
+# Одна keep-alive сессия на процесс: без нового TCP+TLS рукопожатия на каждый запрос.
+# POST /servers не повторяем автоматически, чтобы не создать второй сервер.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "DELETE"]),
+        raise_on_status=False,
+    ),
+))
+
 # ----------------------------------------------------------------------
 # Локации / дата-центры
 # ----------------------------------------------------------------------
@@ -113,6 +167,10 @@ LOCATION_MAP: Dict[str, Dict[str, object]] = {
     },
 }
 
+# Термы поиска приводим к нижнему регистру один раз при импорте
+for _loc in LOCATION_MAP.values():
+    _loc["search"] = tuple(str(term).lower() for term in _loc.get("search", ()))
+
 ProtocolCode = Literal["wireguard", "amneziawg", "openvpn", "socks5", "xray_vless", "trojan_go"]
 
 PROTOCOL_CLASS: Dict[ProtocolCode, str] = {
@@ -132,82 +190,117 @@ TARIFF_RANGES = {
 }
 
 
+# Диапазоны TARIFF_RANGES идут подряд, поэтому уровень ищется бисекцией по верхним границам
+_TIER_CODES = tuple(TARIFF_RANGES)
+_TIER_UPPER_BOUNDS = tuple(max_c for _, max_c in TARIFF_RANGES.values())
+_TIER_MIN = min(min_c for min_c, _ in TARIFF_RANGES.values())
+
+# (класс протокола, уровень) -> (cpu, ram_gb, drive_gb)
+_PLAN_TABLE: Dict[Tuple[str, str], Tuple[int, float, int]] = {
+    ("proxy", "TIER_1"): (1, 1.0, 20),
+    ("proxy", "TIER_2"): (1, 2.0, 20),
+    ("proxy", "TIER_3"): (2, 3.0, 25),
+    ("proxy", "TIER_4"): (3, 4.0, 30),
+    ("vpn_light", "TIER_1"): (1, 1.0, 20),
+    ("vpn_light", "TIER_2"): (2, 2.0, 20),
+    ("vpn_light", "TIER_3"): (3, 4.0, 25),
+    ("vpn_light", "TIER_4"): (4, 6.0, 30),
+    ("vpn_heavy", "TIER_1"): (1, 2.0, 20),
+    ("vpn_heavy", "TIER_2"): (2, 3.0, 25),
+    ("vpn_heavy", "TIER_3"): (4, 6.0, 30),
+    ("vpn_heavy", "TIER_4"): (6, 8.0, 40),
+}
+
+
 def pick_tier_by_configs(configs_count: int) -> str:
-    for code, (min_c, max_c) in TARIFF_RANGES.items():
-        if min_c <= configs_count <= max_c:
-            return code
-    raise ValueError(f"Нельзя подобрать уровень по количеству конфигов: {configs_count}")
+    idx = bisect.bisect_left(_TIER_UPPER_BOUNDS, configs_count)
+    if configs_count < _TIER_MIN or idx == len(_TIER_CODES):
+        raise ValueError(f"Нельзя подобрать уровень по количеству конфигов: {configs_count}")
+    return _TIER_CODES[idx]
 
 
 def auto_plan_resources(protocol: ProtocolCode, configs_count: int) -> Tuple[int, float, int]:
     """Автоматический подбор ресурсов сервера."""
-    tier = pick_tier_by_configs(configs_count)
-    pclass = PROTOCOL_CLASS[protocol]
-
-    cpu = 1
-    ram = 1.0
-    drive = 20
-
-    if pclass == "proxy":
-        if tier == "TIER_1":
-            cpu, ram, drive = 1, 1.0, 20
-        elif tier == "TIER_2":
-            cpu, ram, drive = 1, 2.0, 20
-        elif tier == "TIER_3":
-            cpu, ram, drive = 2, 3.0, 25
-        elif tier == "TIER_4":
-            cpu, ram, drive = 3, 4.0, 30
-
-    elif pclass == "vpn_light":
-        if tier == "TIER_1":
-            cpu, ram, drive = 1, 1.0, 20
-        elif tier == "TIER_2":
-            cpu, ram, drive = 2, 2.0, 20
-        elif tier == "TIER_3":
-            cpu, ram, drive = 3, 4.0, 25
-        elif tier == "TIER_4":
-            cpu, ram, drive = 4, 6.0, 30
-
-    elif pclass == "vpn_heavy":
-        if tier == "TIER_1":
-            cpu, ram, drive = 1, 2.0, 20
-        elif tier == "TIER_2":
-            cpu, ram, drive = 2, 3.0, 25
-        elif tier == "TIER_3":
-            cpu, ram, drive = 4, 6.0, 30
-        elif tier == "TIER_4":
-            cpu, ram, drive = 6, 8.0, 40
-
-    if ram < 1.0:
-        ram = 1.0
-    if drive < 20:
-        drive = 20
-
-    return cpu, ram, drive
+    cpu, ram, drive = _PLAN_TABLE[(PROTOCOL_CLASS[protocol], pick_tier_by_configs(configs_count))]
+    return cpu, max(ram, 1.0), max(drive, 20)
 
 
+@functools.lru_cache(maxsize=1)
 def get_headers() -> Dict[str, str]:
+    """Заголовки авторизации; строятся один раз и сразу ставятся в SESSION."""
     if not API_TOKEN:
         raise RuntimeError("RUVDS_API_TOKEN не задан в .env файле")
-    return {
+    headers = {
         "Authorization": f"Bearer {API_TOKEN}",
         "Accept": "application/json",
     }
+    SESSION.headers.update(headers)
+    return headers
+
+
+def _cached(name: str, ttl: int, fetcher, force_refresh: bool = False):
+    """
+    Cache-aside: вернуть свежий кэш {CACHE_DIR}/{name}.json или вызвать fetcher() и сохранить.
+    Если обновление упало, а устаревший кэш есть — вернуть его.
+    """
+    path = os.path.join(CACHE_DIR, f"{name}.json")
+    stale = None
+    try:
+        age = time.time() - os.path.getmtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            stale = json.load(f)
+        if not force_refresh and age < ttl:
+            return stale
+    except (OSError, ValueError):
+        pass
+
+    try:
+        data = fetcher()
+    except Exception:
+        if stale is not None:
+            return stale
+        raise
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return data
+
+
+def fetch_datacenters(headers: Optional[Dict[str, str]] = None, force_refresh: bool = False) -> List[Dict[str, object]]:
+    def _fetch():
+        url = f"{API_BASE_URL}/datacenters"
+        resp = SESSION.get(url, headers=headers, timeout=_TIMEOUT)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/datacenters {resp.status_code}: {resp.text}")
+        data = _loads(resp.content)
+        if isinstance(data, dict) and "datacenters" in data:
+            dcs = data["datacenters"]
+        else:
+            dcs = data
+        if not isinstance(dcs, list):
+            raise RuntimeError(f"Непонятный формат ответа /datacenters")
+        return dcs
+
+    return _cached("datacenters", CACHE_TTL_DATACENTERS, _fetch, force_refresh)
 
 
-def fetch_datacenters(headers: Dict[str, str]) -> List[Dict[str, object]]:
-    url = f"{API_BASE_URL}/datacenters"
-    resp = requests.get(url, headers=headers, timeout=30)
-    if resp.status_code != 200:
-        raise RuntimeError(f"/datacenters {resp.status_code}: {resp.text}")
-    data = resp.json()
-    if isinstance(data, dict) and "datacenters" in data:
-        dcs = data["datacenters"]
-    else:
-        dcs = data
-    if not isinstance(dcs, list):
-        raise RuntimeError(f"Непонятный формат ответа /datacenters")
-    return dcs
+# Последний построенный индекс ДЦ: (ключ по id в порядке списка, ((имя в нижнем регистре, dc), ...))
+_dc_index_memo: Optional[Tuple[Tuple[object, ...], Tuple[Tuple[str, Dict[str, object]], ...]]] = None
+
+
+def _dc_name_index(datacenters: List[Dict[str, object]]) -> Tuple[Tuple[str, Dict[str, object]], ...]:
+    """Пары (имя в нижнем регистре, dc); повторные аренды с тем же списком ДЦ берут готовый индекс."""
+    global _dc_index_memo
+    key = tuple(dc.get("id") for dc in datacenters)
+    if _dc_index_memo is None or _dc_index_memo[0] != key:
+        _dc_index_memo = (key, tuple((str(dc.get("name", "")).lower(), dc) for dc in datacenters))
+    return _dc_index_memo[1]
 
 
 def select_datacenter_by_location(
@@ -218,12 +311,11 @@ def select_datacenter_by_location(
     if not info:
         raise RuntimeError(f"Неизвестная локация: {location_key}")
 
-    search_terms = [str(s).lower() for s in info.get("search", [])]
+    search_terms = info.get("search", ())
     if not search_terms:
         raise RuntimeError(f"Для локации {location_key} не заданы search-термы.")
 
-    for dc in datacenters:
-        name = str(dc.get("name", "")).lower()
+    for name, dc in _dc_name_index(datacenters):
         if any(term in name for term in search_terms):
             return dc
 
@@ -234,52 +326,96 @@ def select_datacenter_by_location(
     )
 
 
-def fetch_tariffs(headers: Dict[str, str]) -> Dict[str, List[Dict[str, object]]]:
-    url = f"{API_BASE_URL}/tariffs"
-    resp = requests.get(url, headers=headers, timeout=30)
-    if resp.status_code != 200:
-        raise RuntimeError(f"/tariffs {resp.status_code}: {resp.text}")
-    data = resp.json()
-    if not isinstance(data, dict):
-        raise RuntimeError(f"Непонятный формат /tariffs")
-    return data
+@dataclass(frozen=True)
+class Tariffs:
+    """Индекс активных тарифов /tariffs, цены уже приведены к float."""
+    vps_by_id: Dict[int, Tuple[float, float, float]]  # id -> (base_price, price_cpu, price_ram)
+    drive_by_id: Dict[int, float]  # id -> price_gb
+    raw: Dict[str, List[Dict[str, object]]]
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, List[Dict[str, object]]]) -> "Tariffs":
+        vps_all = {int(t["id"]): t for t in raw.get("vps", []) if "id" in t}
+        drive_all = {int(t["id"]): t for t in raw.get("drive", []) if "id" in t}
+        vps_by_id = {
+            vps_id: (
+                float(vps.get("price") or 0.0),
+                float(vps.get("cpu_price") or vps.get("price_cpu") or 0.0),
+                float(vps.get("ram_price") or vps.get("price_ram") or 0.0),
+            )
+            for vps_id, vps in vps_all.items() if vps.get("is_active", True)
+        }
+        drive_by_id = {
+            drv_id: float(drv.get("price") or drv.get("hdd_price") or drv.get("price_gb") or 0.0)
+            for drv_id, drv in drive_all.items() if drv.get("is_active", True)
+        }
+        return cls(vps_by_id=vps_by_id, drive_by_id=drive_by_id, raw=raw)
+
+
+# Индекс тарифов, построенный в этом процессе: (время построения, Tariffs)
+_tariffs_memo: Optional[Tuple[float, Tariffs]] = None
+
 
+def fetch_tariffs(headers: Optional[Dict[str, str]] = None, force_refresh: bool = False) -> Tariffs:
+    global _tariffs_memo
+    if not force_refresh and _tariffs_memo and time.time() - _tariffs_memo[0] < CACHE_TTL_TARIFFS:
+        return _tariffs_memo[1]
 
-def fetch_os_list(headers: Dict[str, str]) -> List[Dict[str, object]]:
-    url = f"{API_BASE_URL}/os"
-    resp = requests.get(url, headers=headers, timeout=30)
-    if resp.status_code != 200:
-        raise RuntimeError(f"/os {resp.status_code}: {resp.text}")
-    data = resp.json()
-    if isinstance(data, dict) and "os" in data:
-        os_list = data["os"]
-    else:
-        os_list = data
-    if not isinstance(os_list, list):
-        raise RuntimeError(f"Непонятный формат /os")
-    return os_list
+    def _fetch():
+        url = f"{API_BASE_URL}/tariffs"
+        resp = SESSION.get(url, headers=headers, timeout=_TIMEOUT)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/tariffs {resp.status_code}: {resp.text}")
+        data = _loads(resp.content)
+        if not isinstance(data, dict):
+            raise RuntimeError(f"Непонятный формат /tariffs")
+        return data
+
+    tariffs = Tariffs.from_raw(_cached("tariffs", CACHE_TTL_TARIFFS, _fetch, force_refresh))
+    _tariffs_memo = (time.time(), tariffs)
+    return tariffs
+
+
+def fetch_os_list(
+    headers: Optional[Dict[str, str]] = None,
+    force_refresh: bool = False,
+) -> Tuple[List[Tuple[str, int]], List[Dict[str, object]]]:
+    """Возвращает (индекс [(имя в нижнем регистре, id)], исходный список /os)."""
+    def _fetch():
+        url = f"{API_BASE_URL}/os"
+        resp = SESSION.get(url, headers=headers, timeout=_TIMEOUT)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/os {resp.status_code}: {resp.text}")
+        data = _loads(resp.content)
+        if isinstance(data, dict) and "os" in data:
+            os_list = data["os"]
+        else:
+            os_list = data
+        if not isinstance(os_list, list):
+            raise RuntimeError(f"Непонятный формат /os")
+        return os_list
 
+    os_list = _cached("os", CACHE_TTL_OS, _fetch, force_refresh)
+    index = [(str(item.get("name", "")).lower(), int(item["id"])) for item in os_list if "id" in item]
+    return index, os_list
 
-def find_os_id(os_list: List[Dict[str, object]], name_part: str) -> int:
+
+def find_os_id(os_index: List[Tuple[str, int]], name_part: str) -> int:
     name_part = name_part.lower()
-    for os_item in os_list:
-        name = str(os_item.get("name", "")).lower()
-        if name_part in name:
-            return int(os_item["id"])
-    raise RuntimeError(f"ОС с именем '{name_part}' не найдена.")
+    os_id = next((oid for name, oid in os_index if name_part in name), None)
+    if os_id is None:
+        raise RuntimeError(f"ОС с именем '{name_part}' не найдена.")
+    return os_id
 
 
 def compute_cheapest_configuration(
     dc: Dict[str, object],
-    tariffs: Dict[str, List[Dict[str, object]]],
+    tariffs: Tariffs,
     cpu: int,
     ram_gb: float,
     drive_gb: int,
     ip: int = 1,
 ) -> Tuple[int, int, float]:
-    vps_tariffs = {int(t["id"]): t for t in tariffs.get("vps", []) if "id" in t}
-    drive_tariffs = {int(t["id"]): t for t in tariffs.get("drive", []) if "id" in t}
-
     available_vps = [int(i) for i in dc.get("vps_tariffs", [])]
     available_drive = [int(i) for i in dc.get("drive_tariffs", [])]
 
@@ -288,42 +424,25 @@ def compute_cheapest_configuration(
     if not available_drive:
         raise RuntimeError("В дата-центре нет доступных тарифов дисков.")
 
-    best: Optional[Tuple[int, int, float]] = None
-
+    # Стоимость VPS не зависит от диска и наоборот: минимум суммы = сумма минимумов, O(N+M)
+    vps_costs = []
     for vps_id in available_vps:
-        vps = vps_tariffs.get(vps_id)
-        if not vps or not vps.get("is_active", True):
-            continue
-
-        price_cpu = float(vps.get("cpu_price") or vps.get("price_cpu") or 0.0)
-        price_ram = float(vps.get("ram_price") or vps.get("price_ram") or 0.0)
-        base_price = float(vps.get("price") or 0.0)
-
-        vps_cost = base_price + cpu * price_cpu + ram_gb * price_ram
-
-        for drv_id in available_drive:
-            drv = drive_tariffs.get(drv_id)
-            if not drv or not drv.get("is_active", True):
-                continue
-
-            price_gb = float(drv.get("price") or drv.get("hdd_price") or drv.get("price_gb") or 0.0)
-            drive_cost = drive_gb * price_gb
-            total = vps_cost + drive_cost
-
-            if best is None or total < best[2]:
-                best = (vps_id, drv_id, total)
-
-    if best is None:
-        for vps_id in available_vps:
-            vps = vps_tariffs.get(vps_id)
-            if vps and vps.get("is_active", True):
-                for drv_id in available_drive:
-                    drv = drive_tariffs.get(drv_id)
-                    if drv and drv.get("is_active", True):
-                        return vps_id, drv_id, 0.0
+        prices = tariffs.vps_by_id.get(vps_id)
+        if prices:
+            base_price, price_cpu, price_ram = prices
+            vps_costs.append((vps_id, base_price + cpu * price_cpu + ram_gb * price_ram))
+    drive_costs = [
+        (drv_id, drive_gb * tariffs.drive_by_id[drv_id])
+        for drv_id in available_drive
+        if drv_id in tariffs.drive_by_id
+    ]
+
+    if not vps_costs or not drive_costs:
         raise RuntimeError("Не удалось подобрать комбинацию тарифов.")
 
-    return best
+    best_vps = min(vps_costs, key=lambda x: x[1])
+    best_drv = min(drive_costs, key=lambda x: x[1])
+    return best_vps[0], best_drv[0], best_vps[1] + best_drv[1]
 
 
 def create_server(
@@ -356,80 +475,30 @@ def create_server(
         "computer_name": computer_name,
         "user_comment": user_comment,
     }
-    resp = requests.post(url, headers=headers, params=params, json=payload, timeout=30)
+    resp = SESSION.post(url, headers=headers, params=params, json=payload, timeout=_TIMEOUT)
     if resp.status_code not in (200, 202):
         raise RuntimeError(f"/servers {resp.status_code}: {resp.text}")
-    return resp.json()
+    return _loads(resp.content)
 
 
-def wait_for_server_ready(
-    headers: Dict[str, str],
-    virtual_server_id: int,
-    poll_interval: int = 15,
-    timeout: int = 1800,
-) -> Dict[str, object]:
-    url = f"{API_BASE_URL}/servers/{virtual_server_id}"
-    deadline = time.time() + timeout
-    last_status = None
-    last_progress = None
-
-    while True:
-        if time.time() > deadline:
-            raise RuntimeError(f"Сервер слишком долго не переходит в статус active. Последний статус: {last_status}, прогресс: {last_progress}%")
+def _backoff_delay(attempt: int, start: float, cap: float) -> float:
+    """Экспоненциальная задержка start*1.5^attempt с потолком cap и джиттером ±25%."""
+    return min(cap, start * 1.5 ** attempt) * random.uniform(0.75, 1.25)
 
-        resp = requests.get(url, headers=headers, timeout=30)
 
-        if resp.status_code == 404:
-            raise RuntimeError(
-                "Сервер в выбранном дата-центре недоступен. "
-                "Выберите другой город/дата-центр."
-            )
-
-        if resp.status_code != 200:
-            raise RuntimeError(f"/servers/{virtual_server_id} {resp.status_code}: {resp.text}")
-
-        data = resp.json()
-        status = data.get("status")
-        progress = data.get("create_progress")
-
-        # Логируем изменения статуса или прогресса
-        if status != last_status or progress != last_progress:
-            print(f"[RUVDS] Сервер {virtual_server_id}: статус='{status}', прогресс={progress}%")
-            last_status = status
-            last_progress = progress
-
-        if status == "active" and (progress is None or progress >= 100):
-            print(f"[RUVDS] Сервер {virtual_server_id} готов к использованию")
-            return data
-
-        if status in ("notpaid", "blocked", "deleted"):
-            raise RuntimeError(f"Сервер перешёл в проблемный статус: {status}")
-
-        time.sleep(poll_interval)
+def _decode_password(password_b64: str) -> Optional[str]:
+    try:
+        return base64.b64decode(password_b64, validate=False).decode("utf-8", errors="replace")
+    except Exception:
+        return None
 
 
-def fetch_start_password(
-    headers: Dict[str, str],
-    virtual_server_id: int,
-    decode: bool = True,
-) -> Dict[str, Optional[str]]:
-    url = f"{API_BASE_URL}/servers/{virtual_server_id}/start_password"
-    params = {"response_format": "base64"}
-    resp = requests.get(url, headers=headers, params=params, timeout=30)
-    if resp.status_code != 200:
-        raise RuntimeError(f"/servers/{virtual_server_id}/start_password {resp.status_code}: {resp.text}")
-
-    data = resp.json()
+def _parse_start_password(data: Dict[str, object], decode: bool = True) -> Dict[str, Optional[str]]:
     login = data.get("login")
     login_type = data.get("login_type")
     password_b64 = data.get("password")
 
-    password_plain: Optional[str] = None
-    if decode and password_b64:
-        try:
-            password_plain = base64.b64decode(password_b64).decode("utf-8", errors="replace")
-        except Exception:
-            password_plain = None
+    password_plain = _decode_password(password_b64) if decode and password_b64 else None
 
     return {
         "login": login,
@@ -439,19 +508,136 @@ def fetch_start_password(
     }
 
 
-def fetch_server_ip(headers: Dict[str, str], virtual_server_id: int) -> Optional[str]:
-    url = f"{API_BASE_URL}/servers/{virtual_server_id}/networks"
-    resp = requests.get(url, headers=headers, timeout=30)
-    if resp.status_code != 200:
-        raise RuntimeError(f"/servers/{virtual_server_id}/networks {resp.status_code}: {resp.text}")
-
-    data = resp.json()
+def _parse_server_ip(data: Dict[str, object]) -> Optional[str]:
     v4_list = data.get("v4") or []
     if isinstance(v4_list, list) and v4_list:
         return v4_list[0].get("ip_address")
     return None
 
 
+async def _get_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    params: Optional[Dict[str, str]] = None,
+) -> Tuple[int, Optional[Dict[str, object]], str]:
+    async with session.get(url, params=params) as resp:
+        body = await resp.read()
+        if resp.status == 200:
+            return resp.status, _loads(body), ""
+        return resp.status, None, body.decode("utf-8", errors="replace")
+
+
+def _ip_from_server_data(data: Dict[str, object]) -> Optional[str]:
+    """IP из ответа /servers/{id}, если API его туда кладёт; иначе None."""
+    ip_addr = data.get("ip") or data.get("ip_address")
+    if isinstance(ip_addr, str) and ip_addr:
+        return ip_addr
+    networks = data.get("networks")
+    if isinstance(networks, dict):
+        return _parse_server_ip(networks)
+    return None
+
+
+async def _await_server_credentials(
+    headers: Dict[str, str],
+    virtual_server_id: int,
+    poll_interval: int = 15,
+    retry_delay: int = 8,
+    max_retries: int = 40,
+    timeout: int = 1800,
+) -> Tuple[str, Dict[str, Optional[str]]]:
+    """
+    Ожидание готовности сервера и получение IP + стартового пароля.
+
+    До статуса active опрашивается только /servers/{id} (из него же берётся IP,
+    если API его возвращает). После active недостающие /networks и
+    /start_password запрашиваются одновременно, пока оба значения не получены.
+    """
+    base_url = f"{API_BASE_URL}/servers/{virtual_server_id}"
+    deadline = time.time() + timeout
+    last_status = None
+    last_progress = None
+    ip_addr: Optional[str] = None
+    creds: Optional[Dict[str, Optional[str]]] = None
+
+    # aiohttp не умеет HTTP/2, поэтому держим опросы на двух тёплых keep-alive соединениях:
+    # keepalive_timeout больше максимальной паузы между опросами, чтобы не повторять TLS-рукопожатие
+    async with aiohttp.ClientSession(
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=30, sock_connect=_POLL_TIMEOUT[0], sock_read=_POLL_TIMEOUT[1]),
+        connector=aiohttp.TCPConnector(limit_per_host=2, keepalive_timeout=60, ttl_dns_cache=300),
+    ) as session:
+        attempt = 0
+        while True:
+            if time.time() > deadline:
+                raise RuntimeError(f"Сервер слишком долго не переходит в статус active. Последний статус: {last_status}, прогресс: {last_progress}%")
+
+            code, data, text = await _get_json(session, base_url)
+            if code == 404:
+                raise RuntimeError(
+                    "Сервер в выбранном дата-центре недоступен. "
+                    "Выберите другой город/дата-центр."
+                )
+            if code != 200:
+                raise RuntimeError(f"/servers/{virtual_server_id} {code}: {text}")
+
+            status = data.get("status")
+            progress = data.get("create_progress")
+
+            # Логируем изменения статуса или прогресса
+            if status != last_status or progress != last_progress:
+                logger.info("Сервер %s: статус=%r, прогресс=%s%%", virtual_server_id, status, progress)
+                last_status = status
+                last_progress = progress
+
+            if status == "active" and (progress is None or progress >= 100):
+                ip_addr = _ip_from_server_data(data)
+                break
+
+            if status in ("notpaid", "blocked", "deleted"):
+                raise RuntimeError(f"Сервер перешёл в проблемный статус: {status}")
+
+            await asyncio.sleep(_backoff_delay(attempt, 2.0, poll_interval))
+            attempt += 1
+
+        for attempt in range(max_retries):
+            need_ip = not ip_addr
+            pending = []
+            if need_ip:
+                pending.append(_get_json(session, f"{base_url}/networks"))
+            pending.append(_get_json(session, f"{base_url}/start_password", {"response_format": "base64"}))
+            results = await asyncio.gather(*pending, return_exceptions=True)
+            net_res = results[0] if need_ip else None
+            pwd_res = results[-1]
+
+            for res in results:
+                if isinstance(res, BaseException):
+                    logger.warning("Ошибка при получении данных: %s", res)
+            if need_ip and not isinstance(net_res, BaseException) and net_res[0] == 200:
+                ip_addr = _parse_server_ip(net_res[1])
+            if not isinstance(pwd_res, BaseException) and pwd_res[0] == 200:
+                creds = _parse_start_password(pwd_res[1], decode=False)
+
+            # Пароль декодируем один раз, когда оба значения уже получены
+            if ip_addr and creds and creds.get("password_b64"):
+                creds["password"] = _decode_password(creds["password_b64"])
+                if creds["password"]:
+                    logger.info("Сервер %s готов, IP=%s", virtual_server_id, ip_addr)
+                    return ip_addr, creds
+
+            if attempt < max_retries - 1:
+                delay = _backoff_delay(attempt, 1.0, retry_delay)
+                if not ip_addr:
+                    logger.info("IP адрес еще не назначен, ожидание %.1fс...", delay)
+                if not creds or not creds.get("password_b64"):
+                    logger.info("Пароль еще не доступен, ожидание %.1fс...", delay)
+                await asyncio.sleep(delay)
+
+    if not ip_addr:
+        raise RuntimeError(f"Не удалось получить IP адрес сервера после {max_retries} попыток")
+    raise RuntimeError(f"Не удалось получить пароль сервера после {max_retries} попыток")
+
+
 def rent_server_for_bot(
     protocol: str,
     configs_count: int,
@@ -489,7 +675,12 @@ def rent_server_for_bot(
     
     # Получение дата-центра
     dcs = fetch_datacenters(headers)
-    dc = select_datacenter_by_location(dcs, location_key)
+    try:
+        dc = select_datacenter_by_location(dcs, location_key)
+    except RuntimeError:
+        # Кэш мог устареть — перечитываем список ДЦ напрямую из API
+        dcs = fetch_datacenters(headers, force_refresh=True)
+        dc = select_datacenter_by_location(dcs, location_key)
     datacenter_id = int(dc["id"])
     
     # Подбор тарифов
@@ -499,8 +690,12 @@ def rent_server_for_bot(
     )
     
     # Получение ОС
-    os_list = fetch_os_list(headers)
-    os_id = find_os_id(os_list, "ubuntu 22.04")
+    os_index, _ = fetch_os_list(headers)
+    try:
+        os_id = find_os_id(os_index, "ubuntu 22.04")
+    except RuntimeError:
+        os_index, _ = fetch_os_list(headers, force_refresh=True)
+        os_id = find_os_id(os_index, "ubuntu 22.04")
     
     # Создание сервера
     create_resp = create_server(
@@ -523,44 +718,8 @@ def rent_server_for_bot(
     if not virtual_server_id:
         raise RuntimeError("API не вернул virtual_server_id")
     
-    # Ожидание готовности
-    wait_for_server_ready(headers, virtual_server_id)
-    
-    # Получение IP и credentials с повторными попытками
-    max_retries = 40
-    retry_delay = 8
-    ip_addr = None
-    creds = None
-    
-    for attempt in range(1, max_retries + 1):
-        print(f"[RUVDS] Попытка {attempt}/{max_retries} получить данные сервера {virtual_server_id}...")
-        
-        try:
-            # Пытаемся получить IP
-            ip_addr = fetch_server_ip(headers, virtual_server_id)
-            
-            # Пытаемся получить credentials
-            creds = fetch_start_password(headers, virtual_server_id, decode=True)
-            
-            # Проверяем, что оба значения получены
-            if ip_addr and creds and creds.get("password"):
-                print(f"[RUVDS] Данные сервера успешно получены: IP={ip_addr}")
-                break
-            else:
-                if not ip_addr:
-                    print(f"[RUVDS] IP адрес еще не назначен, ожидание {retry_delay}с...")
-                if not creds or not creds.get("password"):
-                    print(f"[RUVDS] Пароль еще не доступен, ожидание {retry_delay}с...")
-        except Exception as e:
-            print(f"[RUVDS] Ошибка при получении данных: {e}, ожидание {retry_delay}с...")
-        
-        if attempt < max_retries:
-            time.sleep(retry_delay)
-    
-    if not ip_addr:
-        raise RuntimeError(f"Не удалось получить IP адрес сервера после {max_retries} попыток")
-    if not creds or not creds.get("password"):
-        raise RuntimeError(f"Не удалось получить пароль сервера после {max_retries} попыток")
+    # Ожидание готовности и получение IP + credentials одним циклом опроса
+    ip_addr, creds = asyncio.run(_await_server_credentials(headers, virtual_server_id))
     
     return {
         "ip": ip_addr,
@@ -581,29 +740,37 @@ def delete_server(server_id: str) -> bool:
         True если удаление успешно, False если ошибка
     """
     if not API_TOKEN:
-        print(f"[Удаление] RUVDS_API_TOKEN не найден, пропускаю удаление сервера {server_id}")
+        logger.warning("RUVDS_API_TOKEN не найден, пропускаю удаление сервера %s", server_id)
         return False
     
-    headers = {
-        "Authorization": f"Bearer {API_TOKEN}",
-        "Content-Type": "application/json"
-    }
+    headers = {**get_headers(), "Content-Type": "application/json"}
     
     try:
         url = f"{API_BASE_URL}/servers/{server_id}"
-        resp = requests.delete(url, headers=headers, timeout=30)
+        resp = SESSION.delete(url, headers=headers, timeout=_TIMEOUT)
         
         if resp.status_code in (200, 202, 204):
-            print(f"[Удаление] Сервер id={server_id} успешно удалён")
+            logger.info("Сервер id=%s успешно удалён", server_id)
             return True
         else:
-            print(f"[Удаление] Ошибка при удалении сервера {server_id}: {resp.status_code}: {resp.text}")
+            logger.error("Ошибка при удалении сервера %s: %s: %s", server_id, resp.status_code, resp.text)
             return False
     except Exception as e:
-        print(f"[Удаление] Исключение при удалении сервера {server_id}: {e}")
+        logger.error("Исключение при удалении сервера %s: %s", server_id, e)
         return False
 
 
+def delete_server_async(server_id: str) -> "Future[bool]":
+    """
+    Запускает delete_server в фоновом пуле и сразу возвращает Future.
+
+    Для массового удаления: отправить N задач и дождаться их через
+    concurrent.futures.wait(futures, timeout=...) — запросы идут параллельно
+    через общий пул соединений SESSION.
+    """
+    return _DELETE_EXECUTOR.submit(delete_server, server_id)
+
+
 if __name__ == "__main__":
     # CLI interface для тестирования
     parser = argparse.ArgumentParser()
@@ -8,8 +8,14 @@
 
 import os
 import time
+import bisect
+import secrets
+import itertools
 import logging
-from typing import Dict, Optional
+import threading
+import types
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Final, Mapping, Optional, Tuple
 import asyncio
 
 from dotenv import load_dotenv
@@ -20,15 +26,195 @@ logger = logging.getLogger(__name__)
 
 # Загрузка переменных окружения
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-load_dotenv(os.path.join(BASE_DIR, '.env'))
+# .env читаем только если токен не задан окружением (systemd/docker)
+if not os.getenv("FOURVPS_API_TOKEN"):
+    load_dotenv(os.path.join(BASE_DIR, '.env'))
 
-FOURVPS_API_TOKEN = os.getenv("FOURVPS_API_TOKEN", "")
+
+def _token() -> str:
+    """FOURVPS_API_TOKEN из окружения (читается при каждом вызове, чтобы подмена env подхватывалась)"""
+    return os.getenv("FOURVPS_API_TOKEN", "")
+
+# Нарастающие интервалы опроса статуса/IP (сек): быстрые серверы
+# обнаруживаются раньше, медленные не расходуют лишние запросы к API
+_READY_DELAYS = (2.0, 2.0, 5.0, 5.0, 10.0, 10.0, 15.0)
+# Таймаут одного запроса статуса, чтобы зависший вызов не тормозил опрос
+_POLL_REQUEST_TIMEOUT = 5.0
+# Общий бюджет ожидания IP после перехода в active (сек)
+_IP_WAIT_BUDGET = 120.0
+# Статусы, из которых сервер уже не получит IP
+_DEAD_STATUSES = frozenset(('error', 'destroyed', 'canceled'))
+# Сколько проверок ждать IP у сервера в статусе active
+_ACTIVE_NO_IP_TRIES = 5
+
+
+def _poll_delay(attempt: int) -> float:
+    """Интервал перед следующей проверкой для попытки attempt (с 0)"""
+    return _READY_DELAYS[min(attempt, len(_READY_DELAYS) - 1)]
+
+
+# Общий клиент 4VPS API: один пул соединений на все аренды/удаления
+# в пределах event loop. Основной loop бота и фоновый loop sync-оберток
+# получают каждый свой клиент, чтобы не пересоздавать сессию друг у друга.
+_apis: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, FourVPSAPI]" = weakref.WeakKeyDictionary()
+
+
+async def _get_api() -> FourVPSAPI:
+    """Вернуть клиент FourVPSAPI текущего event loop, создав его при первом обращении"""
+    loop = asyncio.get_running_loop()
+    api = _apis.get(loop)
+    if api is None:
+        api = _apis[loop] = FourVPSAPI(_token())
+    return api
+
+
+async def aclose_api() -> None:
+    """Закрыть клиенты всех event loop (для корректного завершения работы)"""
+    running = asyncio.get_running_loop()
+    while _apis:
+        loop, api = _apis.popitem()
+        if loop is running:
+            await api.close()
+        elif loop.is_running():
+            # Сессия привязана к своему loop - закрываем её там же
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(api.close(), loop))
+
+
+# ----------------------------------------------------------------------
+# Кэш тарифов/образов и результатов подбора (TTL 60с, до 16 записей)
+# ----------------------------------------------------------------------
+
+_CACHE_TTL = 60.0
+_CACHE_MAX = 16
+
+_tariffs_cache: Dict[str, Tuple[float, Dict]] = {}
+_images_cache: Dict[Tuple[int, int], Tuple[float, Dict]] = {}
+# Выбор пресета/ОС хранится вместе с исходным словарем: запись действительна,
+# пока кэш тарифов/образов отдает тот же объект
+_preset_memo: Dict[Tuple[int, int], Tuple[float, Tuple[Dict, int]]] = {}
+_os_memo: Dict[Tuple[int, int], Tuple[float, Tuple[Dict, int]]] = {}
+# Запросы к API, выполняющиеся прямо сейчас: {event loop: {ключ: задача}}
+_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, asyncio.Future[Any]]]" = weakref.WeakKeyDictionary()
+
+
+def _memo_get(cache: Dict, key) -> Any:
+    """Значение из кэша, если запись не старше _CACHE_TTL, иначе None"""
+    hit = cache.get(key)
+    if hit is not None and time.monotonic() - hit[0] < _CACHE_TTL:
+        return hit[1]
+    return None
+
+
+def _memo_put(cache: Dict, key, value) -> None:
+    """Сохранить значение, вытесняя самую старую запись при переполнении"""
+    cache.pop(key, None)
+    cache[key] = (time.monotonic(), value)
+    if len(cache) > _CACHE_MAX:
+        cache.pop(next(iter(cache)))
+
+
+async def _coalesced(key: Tuple, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Выполнить fetch один раз для всех одновременных вызовов с тем же key
+
+    Параллельные аренды в одном ДЦ ждут один и тот же запрос к API.
+    Задачи не разделяются между event loop: у каждого свой набор.
+    shield() не дает отмене одного ожидающего оборвать запрос для остальных.
+    """
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        inflight[key] = task
+        task.add_done_callback(lambda _t: inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _cached_tariffs(api: FourVPSAPI) -> Dict:
+    """Список тарифов всех ДЦ с кэшированием на _CACHE_TTL"""
+    tariffs = _memo_get(_tariffs_cache, 'all')
+    if tariffs is None:
+        tariffs = await _coalesced(('tariffs',), api.get_tariffs)
+        if tariffs:
+            _memo_put(_tariffs_cache, 'all', tariffs)
+    return tariffs
+
+
+async def _cached_images(api: FourVPSAPI, preset_id: int, dc_id: int) -> Dict:
+    """Список образов ОС для (тариф, ДЦ) с кэшированием на _CACHE_TTL"""
+    key = (preset_id, dc_id)
+    images = _memo_get(_images_cache, key)
+    if images is None:
+        images = await _coalesced(('images',) + key, lambda: api.get_images(preset_id, dc_id))
+        if images:
+            _memo_put(_images_cache, key, images)
+    return images
+
+
+# Приоритет образов ОС (меньше - предпочтительнее) и запасной вариант
+# для любой другой Linux-системы
+_OS_PRIORITY: Final[Mapping[str, int]] = types.MappingProxyType({
+    "ubuntu 22.04": 0,
+    "ubuntu 20.04": 1,
+    "debian 11": 2,
+    "debian 10": 3,
+    "ubuntu": 4,  # любая ubuntu
+})
+LINUX_FAMILIES: Final[Tuple[str, ...]] = ('ubuntu', 'debian', 'centos', 'rocky', 'alma')
+
+# Маппинг протоколов бота на коды 4VPS (аналогично RUVDS)
+_PROTOCOL_MAP: Final[Mapping[str, str]] = types.MappingProxyType({
+    "wg": "wireguard",
+    "awg": "amneziawg",
+    "ovpn": "openvpn",
+    "socks5": "socks5",
+    "xray": "xray_vless",
+    "trojan": "trojan_go"
+})
+
+# Периоды бота -> часы аренды 4VPS
+_PERIOD_MAP: Final[Mapping[str, int]] = types.MappingProxyType({
+    "1w": 720,      # 1 неделя → аренда на 1 месяц (минимум)
+    "1m": 720,      # 1 месяц → 720 часов
+    "2m": 2160,     # 2 месяца → округляем до 3 месяцев
+    "3m": 2160,     # 3 месяца → 2160 часов
+    "6m": 4320,     # 6 месяцев → 4320 часов
+    "12m": 8640     # 12 месяцев → 8640 часов
+})
+_OS_LINUX_FALLBACK = 5
+_OS_NO_MATCH = 99
 
 
 # ----------------------------------------------------------------------
 # Маппинг тарифов 4VPS на количество конфигов
 # ----------------------------------------------------------------------
 
+# До такого числа пресетов линейный проход быстрее сортировки
+_LINEAR_PRESETS_MAX = 8
+# Отсортированные пресеты по id(словаря тарифов); словарь живет в кэше тарифов
+_sorted_presets_memo: Dict[int, Tuple[float, Tuple]] = {}
+
+
+def _preset_rank(row: Tuple) -> Tuple:
+    """Порядок выбора среди пресетов: цена, затем cpu, ram и id (одинаков для обоих путей)"""
+    cpu, ram_mib, price, preset_id = row
+    return (price, cpu, ram_mib, preset_id)
+
+
+def _sorted_presets(available_presets: Dict) -> Tuple[list, list, int]:
+    """Пресеты, отсортированные по (cpu, ram, цена, id), список cpu для bisect и самый дешевый id"""
+    hit = _memo_get(_sorted_presets_memo, id(available_presets))
+    if hit is not None and hit[0] is available_presets:
+        return hit[1]
+    rows = sorted(
+        (info.get('cpu_number', 0), info.get('ram_mib', 0), info.get('price', 9999999), int(pid))
+        for pid, info in available_presets.items()
+    )
+    cheapest_id = min(rows, key=_preset_rank)[3]
+    result = (rows, [r[0] for r in rows], cheapest_id)
+    _memo_put(_sorted_presets_memo, id(available_presets), (available_presets, result))
+    return result
+
+
 def auto_plan_preset_4vps(protocol: str, configs_count: int, available_presets: Dict) -> int:
     """
     Автоматический подбор пресета 4VPS на основе количества конфигов
@@ -61,47 +247,53 @@ def auto_plan_preset_4vps(protocol: str, configs_count: int, available_presets:
         target_cpu = 4
         target_ram = 8
     
-    # Ищем САМЫЙ ДЕШЕВЫЙ пресет среди подходящих
-    best_preset = None
-    best_price = float('inf')
-    
     logger.info(f"auto_plan_preset_4vps: Target resources - CPU={target_cpu}, RAM={target_ram}GB, Configs={configs_count}")
-    logger.info(f"auto_plan_preset_4vps: Available presets: {list(available_presets.keys())}")
+    
+    # Для длинного списка - двоичный поиск по отсортированным пресетам
+    if len(available_presets) > _LINEAR_PRESETS_MAX:
+        rows, cpus, cheapest_id = _sorted_presets(available_presets)
+        target_ram_mib = target_ram * 1024
+        suitable = [row for row in rows[bisect.bisect_left(cpus, target_cpu):] if row[1] >= target_ram_mib]
+        return min(suitable, key=_preset_rank)[3] if suitable else cheapest_id
+    
+    # Один проход: самый дешевый подходящий пресет и самый дешевый вообще
+    # (запасной вариант, если подходящих нет)
+    best_rank = None
+    cheapest_rank = None
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
+    if debug:
+        logger.debug(f"auto_plan_preset_4vps: Available presets: {list(available_presets.keys())}")
     
     for preset_id_str, preset_info in available_presets.items():
         cpu = preset_info.get('cpu_number', 0)
         ram_mib = preset_info.get('ram_mib', 0)
         ram_gb = ram_mib / 1024.0
         price = preset_info.get('price', 9999999)
-        preset_name = preset_info.get('name', preset_id_str)
+        rank = _preset_rank((cpu, ram_mib, price, int(preset_id_str)))
         
-        logger.info(f"  Preset {preset_name} (ID {preset_id_str}): {cpu} CPU, {ram_gb:.1f}GB RAM, {price}₽/month")
+        if debug:
+            preset_name = preset_info.get('name', preset_id_str)
+            logger.debug(f"  Preset {preset_name} (ID {preset_id_str}): {cpu} CPU, {ram_gb:.1f}GB RAM, {price}₽/month")
         
-        # Проверяем, что ресурсы не меньше требуемых
-        if cpu >= target_cpu and ram_gb >= target_ram:
-            # Выбираем самый дешевый
-            if price < best_price:
-                best_price = price
-                best_preset = int(preset_id_str)
-                logger.info(f"    ✓ MATCHES requirements and cheaper than previous ({price} < {best_price}₽)")
+        if cheapest_rank is None or rank < cheapest_rank:
+            cheapest_rank = rank
+        
+        # Ресурсы не меньше требуемых и дешевле уже найденного
+        if cpu >= target_cpu and ram_gb >= target_ram and (best_rank is None or rank < best_rank):
+            old_best = best_rank[0] if best_rank is not None else float('inf')
+            best_rank = rank
+            if debug:
+                logger.debug(f"    ✓ MATCHES requirements and cheaper than previous ({price} < {old_best}₽)")
     
     # Если не нашли подходящий, берём самый дешевый из всех доступных
-    if best_preset is None and available_presets:
-        cheapest_preset = None
-        cheapest_price = float('inf')
-        
-        for preset_id_str, preset_info in available_presets.items():
-            price = preset_info.get('price', 9999999)
-            if price < cheapest_price:
-                cheapest_price = price
-                cheapest_preset = int(preset_id_str)
-        
-        best_preset = cheapest_preset
+    if best_rank is None:
+        best_rank = cheapest_rank
     
-    if best_preset is None:
+    if best_rank is None:
         raise RuntimeError("Не найдены доступные тарифы для выбранного дата-центра")
     
-    return best_preset
+    return best_rank[3]
 
 
 def get_os_id_4vps(protocol: str, available_os: Dict) -> int:
@@ -117,26 +309,22 @@ def get_os_id_4vps(protocol: str, available_os: Dict) -> int:
     Returns:
         os_id: ID образа ОС
     """
-    # Приоритетный список ОС
-    preferred_os = [
-        "ubuntu 22.04",
-        "ubuntu 20.04", 
-        "debian 11",
-        "debian 10",
-        "ubuntu"  # любая ubuntu
-    ]
-    
-    # Поиск по приоритету
-    for pref in preferred_os:
-        for os_id_str, os_name in available_os.items():
-            if pref in os_name.lower():
-                return int(os_id_str)
-    
-    # Если не нашли предпочтительную, берём первую доступную Linux-систему
+    # Один проход: имя приводится к нижнему регистру один раз, каждой ОС
+    # назначается балл (меньше - лучше), при равенстве побеждает первая
+    best_score = _OS_NO_MATCH
+    best_id = None
     for os_id_str, os_name in available_os.items():
         os_lower = os_name.lower()
-        if any(x in os_lower for x in ['ubuntu', 'debian', 'centos', 'rocky', 'alma']):
-            return int(os_id_str)
+        score = min((rank for pref, rank in _OS_PRIORITY.items() if pref in os_lower), default=_OS_NO_MATCH)
+        if score == _OS_NO_MATCH and any(x in os_lower for x in LINUX_FAMILIES):
+            score = _OS_LINUX_FALLBACK
+        if score < best_score:
+            best_score, best_id = score, os_id_str
+            if score == 0:
+                break
+    
+    if best_id is not None:
+        return int(best_id)
     
     # В крайнем случае берём первую доступную
     if available_os:
@@ -157,15 +345,7 @@ def map_period_to_4vps(period_key: str) -> Optional[int]:
     
     Бот использует: 1w, 1m, 2m, 3m, 6m, 12m
     """
-    period_map = {
-        "1w": 720,      # 1 неделя → аренда на 1 месяц (минимум)
-        "1m": 720,      # 1 месяц → 720 часов
-        "2m": 2160,     # 2 месяца → округляем до 3 месяцев
-        "3m": 2160,     # 3 месяца → 2160 часов
-        "6m": 4320,     # 6 месяцев → 4320 часов
-        "12m": 8640     # 12 месяцев → 8640 часов
-    }
-    return period_map.get(period_key, 720)  # По умолчанию 1 месяц
+    return _PERIOD_MAP.get(period_key, 720)  # По умолчанию 1 месяц
 
 
 async def rent_server_for_bot_4vps(
@@ -188,30 +368,19 @@ async def rent_server_for_bot_4vps(
     Returns:
         dict: {"ip": "...", "login": "...", "password": "...", "server_id": "..."}
     """
-    if not FOURVPS_API_TOKEN:
+    if not _token():
         raise RuntimeError("FOURVPS_API_TOKEN не найден в .env")
     
-    # Маппинг протоколов (аналогично RUVDS)
-    protocol_map = {
-        "wg": "wireguard",
-        "awg": "amneziawg",
-        "ovpn": "openvpn",
-        "socks5": "socks5",
-        "xray": "xray_vless",
-        "trojan": "trojan_go"
-    }
-    protocol_code = protocol_map.get(protocol, "wireguard")
+    protocol_code = _PROTOCOL_MAP.get(protocol, "wireguard")
     
-    # Создаем API клиент
-    api = FourVPSAPI(FOURVPS_API_TOKEN)
+    # Общий API клиент (переиспользует соединения)
+    api = await _get_api()
     
-    # Проверяем баланс (опционально, как в RUVDS)
-    balance = await api.get_balance()
+    # Баланс (опционально, как в RUVDS) и тарифы всех ДЦ (шаг 1) - независимые запросы, выполняем параллельно
+    balance, all_tariffs = await asyncio.gather(api.get_balance(), _cached_tariffs(api))
     if balance is not None and balance < 500:
         raise RuntimeError(f"Недостаточно средств на балансе: {balance}₽ (минимум 500₽)")
     
-    # Шаг 1: Получаем список тарифов для всех дата-центров
-    all_tariffs = await api.get_tariffs()
     if not all_tariffs:
         raise RuntimeError("Не удалось получить список тарифов")
     
@@ -227,25 +396,34 @@ async def rent_server_for_bot_4vps(
     if not available_presets:
         raise RuntimeError(f"Нет доступных пресетов для дата-центра {dc_id}")
     
-    # Шаг 3: Автоподбор пресета на основе конфигов
-    preset_id = auto_plan_preset_4vps(protocol_code, configs_count, available_presets)
-    
-    # Шаг 4: Получаем список доступных образов ОС для этого тарифа
-    available_os = await api.get_images(preset_id, dc_id)
-    if not available_os:
-        raise RuntimeError(f"Не удалось получить список образов ОС для тарифа {preset_id}")
+    # Шаг 3: Автоподбор пресета на основе конфигов (запоминается на время жизни кэша тарифов)
+    preset_key = (dc_id, configs_count)
+    hit = _memo_get(_preset_memo, preset_key)
+    if hit is not None and hit[0] is available_presets:
+        preset_id = hit[1]
+    else:
+        preset_id = auto_plan_preset_4vps(protocol_code, configs_count, available_presets)
+        _memo_put(_preset_memo, preset_key, (available_presets, preset_id))
     
-    # Шаг 5: Выбираем образ ОС
-    os_id = get_os_id_4vps(protocol, available_os)
+    # Шаг 4: Запрашиваем образы ОС для этого тарифа в фоне (если выбор ОС не закэширован)
+    os_key = (preset_id, dc_id)
+    hit = _memo_get(_os_memo, os_key)
+    os_id = hit[1] if hit is not None and hit[0] is _memo_get(_images_cache, os_key) else None
+    images_task = asyncio.create_task(_cached_images(api, preset_id, dc_id)) if os_id is None else None
     
-    # Шаг 6: Конвертация периода
+    # Шаг 5: Конвертация периода
     period_hours = map_period_to_4vps(payment_period)
     
-    # Шаг 7: Генерация имени сервера (аналогично RUVDS)
-    import random
-    import string
-    random_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
-    server_name = f"vpn-{protocol}-{random_suffix}"
+    # Шаг 6: Генерация имени сервера (аналогично RUVDS)
+    server_name = f"vpn-{protocol}-{secrets.token_hex(4)}"
+    
+    # Шаг 7: Выбираем образ ОС
+    if images_task is not None:
+        available_os = await images_task
+        if not available_os:
+            raise RuntimeError(f"Не удалось получить список образов ОС для тарифа {preset_id}")
+        os_id = get_os_id_4vps(protocol, available_os)
+        _memo_put(_os_memo, os_key, (available_os, os_id))
     
     # Шаг 8: Создание сервера через 4VPS API
     result = await api.buy_server(
@@ -265,35 +443,45 @@ async def rent_server_for_bot_4vps(
     if not server_id or not password:
         raise RuntimeError(f"Провайдер вернул неполные данные: {result}")
     
-    # Шаг 9: Ожидание готовности сервера (аналогично RUVDS wait_for_server_ready)
+    # Шаг 9: Ожидание готовности сервера (аналогично RUVDS _await_server_credentials)
     await wait_for_4vps_server_ready(api, int(server_id))
     
     # Шаг 10: Получение IP адреса сервера с повторными попытками
     ip_addr = None
-    max_retries = 40  # Максимум 40 попыток
-    retry_delay = 8  # Задержка между попытками в секундах
+    ip_started = time.monotonic()
+    active_without_ip = 0
     
-    for attempt in range(1, max_retries + 1):
-        logger.info(f"[4VPS] Попытка {attempt}/{max_retries} получить данные сервера {server_id}...")
+    for attempt in itertools.count():
+        logger.info(f"[4VPS] Попытка {attempt + 1} получить данные сервера {server_id}...")
         
-        server_info = await api.get_server_info(int(server_id))
+        server_info = await api.get_server_info(int(server_id), timeout=_POLL_REQUEST_TIMEOUT)
+        delay = _poll_delay(attempt)
         
         if server_info and server_info.get('serverInfo'):
             ip_addr = server_info['serverInfo'].get('ipv4')
+            status = server_info['serverInfo'].get('status')
             
             if ip_addr:
                 logger.info(f"[4VPS] IP адрес получен: {ip_addr}")
                 break
-            else:
-                logger.warning(f"[4VPS] IP адрес еще не назначен, ожидание {retry_delay}с...")
+            if status in _DEAD_STATUSES:
+                raise RuntimeError(f"Сервер {server_id} перешел в статус '{status}' до назначения IP адреса")
+            if status == 'active':
+                # Активный сервер без IP - сбой на стороне провайдера, а не долгая сборка
+                active_without_ip += 1
+                if active_without_ip >= _ACTIVE_NO_IP_TRIES:
+                    logger.critical(f"[4VPS] Сервер {server_id} активен, но IP не назначен после {active_without_ip} проверок")
+                    raise RuntimeError(f"Сервер {server_id} активен, но провайдер не назначил IP адрес")
+            logger.warning(f"[4VPS] IP адрес еще не назначен (статус '{status}'), ожидание {delay}с...")
         else:
-            logger.warning(f"[4VPS] Информация о сервере пока недоступна, ожидание {retry_delay}с...")
+            logger.warning(f"[4VPS] Информация о сервере пока недоступна, ожидание {delay}с...")
         
-        if attempt < max_retries:
-            await asyncio.sleep(retry_delay)
+        if time.monotonic() - ip_started + delay > _IP_WAIT_BUDGET:
+            break
+        await asyncio.sleep(delay)
     
     if not ip_addr:
-        raise RuntimeError(f"Не удалось получить IP адрес сервера {server_id} после {max_retries} попыток. Возможно, сервер еще не полностью развернут.")
+        raise RuntimeError(f"Не удалось получить IP адрес сервера {server_id} за {int(_IP_WAIT_BUDGET)}с. Возможно, сервер еще не полностью развернут.")
     
     # Определяем логин (для Linux всегда root)
     login = "root"
@@ -310,27 +498,27 @@ async def wait_for_4vps_server_ready(api: FourVPSAPI, server_id: int, timeout: i
     """
     Ожидание готовности сервера на 4VPS
     
-    Аналогично wait_for_server_ready() из rent_server.py (RUVDS)
+    Аналогично _await_server_credentials() из rent_server.py (RUVDS)
     
     Args:
         api: Клиент 4VPS API
         server_id: ID сервера
         timeout: Максимальное время ожидания в секундах
     """
-    start_time = time.time()
+    start_time = time.monotonic()
     last_status = None
     
-    while True:
-        elapsed = time.time() - start_time
+    for attempt in itertools.count():
+        elapsed = time.monotonic() - start_time
         if elapsed > timeout:
             raise RuntimeError(f"Таймаут ожидания готовности сервера {server_id} (>{timeout}s). Последний статус: {last_status}")
         
         # Получаем информацию о сервере
-        server_info = await api.get_server_info(server_id)
+        server_info = await api.get_server_info(server_id, timeout=_POLL_REQUEST_TIMEOUT)
         
         if not server_info or not server_info.get('serverInfo'):
             logger.warning(f"[4VPS] Сервер {server_id}: информация пока недоступна, ожидание...")
-            await asyncio.sleep(10)
+            await asyncio.sleep(_poll_delay(attempt))
             continue
         
         status = server_info['serverInfo'].get('status')
@@ -349,8 +537,8 @@ async def wait_for_4vps_server_ready(api: FourVPSAPI, server_id: int, timeout: i
             logger.info(f"[4VPS] Сервер {server_id} готов к использованию")
             return
         
-        # Ждем 10 секунд перед следующей проверкой
-        await asyncio.sleep(10)
+        # Интервал растет от 2 до 15 секунд
+        await asyncio.sleep(_poll_delay(attempt))
 
 
 async def delete_server_4vps(server_id: str) -> bool:
@@ -365,27 +553,58 @@ async def delete_server_4vps(server_id: str) -> bool:
     Returns:
         True если удаление успешно, False если ошибка
     """
-    if not FOURVPS_API_TOKEN:
-        print(f"[Удаление 4VPS] FOURVPS_API_TOKEN не найден, пропускаю удаление сервера {server_id}")
+    if not _token():
+        logger.warning("[Удаление 4VPS] FOURVPS_API_TOKEN не найден, пропускаю удаление сервера %s", server_id)
         return False
     
     try:
-        api = FourVPSAPI(FOURVPS_API_TOKEN)
+        api = await _get_api()
         success = await api.delete_server(int(server_id))
         
         if success:
-            print(f"[Удаление 4VPS] Сервер {server_id} успешно удален")
+            logger.info("[Удаление 4VPS] Сервер %s успешно удален", server_id, extra={"server_id": server_id})
             return True
         else:
-            print(f"[Удаление 4VPS] Не удалось удалить сервер {server_id}")
+            logger.warning("[Удаление 4VPS] Не удалось удалить сервер %s", server_id, extra={"server_id": server_id})
             return False
             
-    except Exception as e:
-        print(f"[Удаление 4VPS] Ошибка при удалении сервера {server_id}: {e}")
+    except Exception:
+        logger.exception("[Удаление 4VPS] Ошибка при удалении сервера %s", server_id)
         return False
 
 
-# Синхронные обертки для совместимости с существующим кодом
+# Синхронные обертки для совместимости с существующим кодом.
+# Все sync-вызовы выполняются в одном фоновом event loop, чтобы его
+# клиент API и keep-alive соединения переживали отдельные вызовы.
+_bg_loop: Optional[asyncio.AbstractEventLoop] = None
+_bg_loop_lock = threading.Lock()
+
+
+def _get_bg_loop() -> asyncio.AbstractEventLoop:
+    """Вернуть фоновый event loop, запустив его поток при первом вызове"""
+    global _bg_loop
+    if _bg_loop is None:
+        with _bg_loop_lock:
+            if _bg_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="4vps-sync-loop", daemon=True).start()
+                _bg_loop = loop
+    return _bg_loop
+
+
+def _run_sync(coro):
+    """Выполнить корутину в фоновом loop и дождаться результата"""
+    loop = _get_bg_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("sync-обертку 4VPS нельзя вызывать из её фонового event loop")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
 def rent_server_for_bot_4vps_sync(
     protocol: str,
     configs_count: int,
@@ -393,21 +612,9 @@ def rent_server_for_bot_4vps_sync(
     payment_period: str = "1m",
 ) -> Dict[str, str]:
     """Синхронная версия rent_server_for_bot_4vps для вызова из sync-контекста"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(
-            rent_server_for_bot_4vps(protocol, configs_count, dc_id, payment_period)
-        )
-    finally:
-        loop.close()
+    return _run_sync(rent_server_for_bot_4vps(protocol, configs_count, dc_id, payment_period))
 
 
 def delete_server_4vps_sync(server_id: str) -> bool:
     """Синхронная версия delete_server_4vps для вызова из sync-контекста"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(delete_server_4vps(server_id))
-    finally:
-        loop.close()
+    return _run_sync(delete_server_4vps(server_id))
@@ -1,23 +1,135 @@
 from __future__ import annotations
-from typing import Optional, Dict
+import os
+import time
+import logging
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Tuple
 
+import aiosqlite
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters
 
-# In-memory state for support chat
-SUPPORT_REPLY_PENDING: Dict[int, str] = {} # one-shot reply: {sender_id: 'admin'|'user:<id>'}
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, 'bot.db')
+DB_PRAGMAS = "PRAGMA journal_mode=WAL; PRAGMA busy_timeout=30000; PRAGMA synchronous=NORMAL;"
+SUPPORT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS support_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    message_text TEXT,
+    is_from_user INTEGER DEFAULT 1,
+    is_read INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# In-memory state for support chat: one-shot reply {sender_id: ('admin'|'user:<id>', set_at)}.
+# LRU-bounded with a TTL so abandoned requests do not accumulate forever.
+SUPPORT_REPLY_PENDING: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+_PENDING_MAX = 10_000
+_PENDING_TTL = 86400  # seconds
+
+
+def _set_pending(uid: int, state: str) -> None:
+    SUPPORT_REPLY_PENDING[uid] = (state, time.monotonic())
+    SUPPORT_REPLY_PENDING.move_to_end(uid)
+    if len(SUPPORT_REPLY_PENDING) > _PENDING_MAX:
+        SUPPORT_REPLY_PENDING.popitem(last=False)
+
+
+def _pop_pending(uid: int) -> Optional[str]:
+    item = SUPPORT_REPLY_PENDING.pop(uid, None)
+    if item is None or time.monotonic() - item[1] > _PENDING_TTL:
+        return None
+    return item[0]
+
+
+async def _cleanup_pending(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop expired one-shot states; the dict is ordered oldest first."""
+    cutoff = time.monotonic() - _PENDING_TTL
+    while SUPPORT_REPLY_PENDING:
+        uid, (_, ts) = next(iter(SUPPORT_REPLY_PENDING.items()))
+        if ts > cutoff:
+            break
+        del SUPPORT_REPLY_PENDING[uid]
+
+# One connection for all support traffic; the DDL runs once when it is opened
+_DB: Optional[aiosqlite.Connection] = None
+_DB_LOCK = asyncio.Lock()
+_WRITE_LOCK = asyncio.Lock()
+
+
+async def _db() -> aiosqlite.Connection:
+    global _DB
+    if _DB is None:
+        async with _DB_LOCK:
+            if _DB is None:
+                db = await aiosqlite.connect(DB_PATH, timeout=30)
+                await db.executescript(DB_PRAGMAS + SUPPORT_SCHEMA)
+                await db.commit()
+                _DB = db
+    return _DB
+
+
+async def close_db() -> None:
+    """Close the shared connection so its aiosqlite worker thread does not block process exit."""
+    global _DB
+    db, _DB = _DB, None
+    if db is not None:
+        await db.close()
+
+
+async def save_message_to_db(user_id: int, message_text: str, is_from_user: bool) -> None:
+    """Store a support message for the CRM."""
+    try:
+        db = await _db()
+        async with _WRITE_LOCK:
+            await db.execute(
+                "INSERT INTO support_messages (user_id, message_text, is_from_user, is_read) VALUES (?, ?, ?, 0)",
+                (user_id, message_text, 1 if is_from_user else 0),
+            )
+            await db.commit()
+    except Exception:
+        logger.exception("Error saving support message to DB")
+
+
+async def _user_stats(uid: int) -> Tuple[int, int, float]:
+    """(orders, deposits, deposits sum in USDT) in one round-trip."""
+    db = await _db()
+    cur = await db.execute(
+        "SELECT (SELECT COUNT(*) FROM orders WHERE user_id=?),"
+        " (SELECT COUNT(*) FROM deposits WHERE user_id=?),"
+        " (SELECT IFNULL(SUM(expected_amount_usdt),0) FROM deposits WHERE user_id=?)",
+        (uid, uid, uid),
+    )
+    row = await cur.fetchone()
+    if not row:
+        return 0, 0, 0.0
+    return row[0] or 0, row[1] or 0, float(row[2] or 0)
+
+
+# Telegram limits for message text and media captions
+_TEXT_LIMIT = 4096
+_CAPTION_LIMIT = 1024
+
+
+def _has_caption_media(msg) -> bool:
+    return bool(msg.photo or msg.document or msg.video or msg.audio or msg.voice or msg.animation)
 
 
 def _user_title(u) -> str:
-    uname = f"@{u.username}" if getattr(u, 'username', None) else "—"
-    return f"{u.full_name} {uname} <code>{u.id}</code>"
+    username = getattr(u, 'username', None)
+    return "%s %s <code>%d</code>" % (u.full_name, "@" + username if username else "—", u.id)
 
 
 async def support_start(update: Update, context: ContextTypes.DEFAULT_TYPE, admin_id: int) -> None:
     user = update.effective_user
     uid = user.id
     # One-shot: the very next message will go to admin
-    SUPPORT_REPLY_PENDING[uid] = 'admin'
+    _set_pending(uid, 'admin')
     # Tell user with better instructions
     kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отменить", callback_data="support:cancel")]])
     await update.effective_message.reply_text(
@@ -46,7 +158,7 @@ async def support_set_reply_cmd(update: Update, context: ContextTypes.DEFAULT_TY
         await update.effective_message.reply_text("Некорректный user_id")
         return
     # One-shot: next admin message will go to this user
-    SUPPORT_REPLY_PENDING[admin_id] = f'user:{target}'
+    _set_pending(admin_id, f'user:{target}')
     await update.effective_message.reply_text(f"Следующее сообщение будет отправлено пользователю {target}")
 
 
@@ -60,15 +172,15 @@ async def support_on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
             await update.callback_query.answer()
             return
         # Clear pending state
-        SUPPORT_REPLY_PENDING.pop(uid, None)
+        _pop_pending(uid)
         await update.callback_query.answer("Отменено")
         try:
             await update.callback_query.edit_message_text(
                 "❌ Обращение в поддержку отменено.\n\n"
                 "Если понадобится помощь, нажмите 📞 Поддержка в главном меню."
             )
-        except Exception as e:
-            print(f"Support cancel edit_message_text error: {e}")
+        except Exception:
+            logger.debug("Support cancel edit_message_text error", exc_info=True)
         return
     
     # User taps reply button to answer admin
@@ -76,12 +188,12 @@ async def support_on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         if not uid:
             await update.callback_query.answer()
             return
-        SUPPORT_REPLY_PENDING[uid] = 'admin'
+        _set_pending(uid, 'admin')
         await update.callback_query.answer("Напишите ответ администратору")
         try:
             await update.callback_query.edit_message_reply_markup(reply_markup=None)
-        except Exception as e:
-            print(f"Support reply_admin edit_markup error: {e}")
+        except Exception:
+            logger.debug("Support reply_admin edit_markup error", exc_info=True)
         # Visible instruction for the user
         try:
             kb = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отменить", callback_data="support:cancel")]])
@@ -91,8 +203,8 @@ async def support_on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
                 parse_mode='HTML',
                 reply_markup=kb
             )
-        except Exception as e:
-            print(f"Support reply_admin instruction error: {e}")
+        except Exception:
+            logger.warning("Support reply_admin instruction error", exc_info=True)
         return
     # Admin taps reply under user's message
     if data.startswith('support:reply:'):
@@ -104,18 +216,18 @@ async def support_on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         except Exception:
             await update.callback_query.answer("Ошибка")
             return
-        SUPPORT_REPLY_PENDING[admin_id] = f'user:{target}'
+        _set_pending(admin_id, f'user:{target}')
         await update.callback_query.answer("Напишите ответ")
         try:
             await update.callback_query.edit_message_reply_markup(reply_markup=None)
-        except Exception as e:
-            print(f"Support reply edit_markup error: {e}")
+        except Exception:
+            logger.debug("Support reply edit_markup error", exc_info=True)
         # Visible instruction for the admin
         try:
             await update.callback_query.message.reply_text(
                 f"✍️ Напишите сообщение для ответа пользователю {target} и отправьте его боту.")
-        except Exception as e:
-            print(f"Support reply instruction error: {e}")
+        except Exception:
+            logger.warning("Support reply instruction error", exc_info=True)
 
 
 async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, admin_id: int) -> None:
@@ -123,38 +235,6 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
     msg = update.effective_message
     u = update.effective_user
     
-    # Save message to database for CRM
-    async def save_message_to_db(user_id: int, message_text: str, is_from_user: bool):
-        try:
-            import aiosqlite
-            try:
-                from .main import DB_PATH  # type: ignore
-            except:
-                from main import DB_PATH  # type: ignore
-            
-            async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-                # Create table if not exists
-                await db.execute('''
-                    CREATE TABLE IF NOT EXISTS support_messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        message_text TEXT,
-                        is_from_user INTEGER DEFAULT 1,
-                        is_read INTEGER DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # Insert message
-                await db.execute('''
-                    INSERT INTO support_messages (user_id, message_text, is_from_user, is_read)
-                    VALUES (?, ?, ?, 0)
-                ''', (user_id, message_text, 1 if is_from_user else 0))
-                
-                await db.commit()
-        except Exception as e:
-            print(f"Error saving support message to DB: {e}")
-    
     # Admin sends — route only if a target was selected via reply button or /reply
     if u and u.id == admin_id:
         # If admin is currently in another admin flow (e.g., top-up, search, goto),
@@ -170,11 +250,11 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
             if _ADMIN_ACTION_STATE.get(admin_id):
                 # Let other handlers (unknown_message) process this admin input silently
                 return
-        except Exception as e:
-            print(f"Support ADMIN_ACTION_STATE check error: {e}")
+        except Exception:
+            logger.exception("Support ADMIN_ACTION_STATE check error")
         # One-shot pending has priority
         target_id: Optional[int] = None
-        pend = SUPPORT_REPLY_PENDING.pop(admin_id, None)
+        pend = _pop_pending(admin_id)
         if pend and pend.startswith('user:'):
             try:
                 target_id = int(pend.split(':', 1)[1])
@@ -182,23 +262,39 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
                 target_id = None
         if target_id:
             try:
-                # Notify user that admin replied
-                try:
+                kb = InlineKeyboardMarkup([[InlineKeyboardButton("💬 Ответить", callback_data="support:reply_admin")]])
+                header = "💬 <b>Новый ответ от администратора:</b>"
+                if msg.text and len(msg.text) <= _TEXT_LIMIT - len(header) - 2:
+                    # Text: header and reply in one message
                     await context.bot.send_message(
                         chat_id=target_id,
-                        text="💬 <b>Новый ответ от администратора:</b>",
-                        parse_mode='HTML'
+                        text=f"{header}\n\n{msg.text_html}",
+                        parse_mode='HTML',
+                        reply_markup=kb
                     )
-                except Exception as e:
-                    print(f"Support admin reply header send error: {e}")
-                
-                kb = InlineKeyboardMarkup([[InlineKeyboardButton("💬 Ответить", callback_data="support:reply_admin")]])
-                await context.bot.copy_message(chat_id=target_id, from_chat_id=msg.chat_id, message_id=msg.message_id, reply_markup=kb)
+                elif _has_caption_media(msg) and len(msg.caption or '') <= _CAPTION_LIMIT - len(header) - 2:
+                    # Media: single copy with the header prepended to the caption
+                    caption = f"{header}\n\n{msg.caption_html}" if msg.caption else header
+                    await context.bot.copy_message(
+                        chat_id=target_id,
+                        from_chat_id=msg.chat_id,
+                        message_id=msg.message_id,
+                        caption=caption,
+                        parse_mode='HTML',
+                        reply_markup=kb
+                    )
+                else:
+                    # Stickers, video notes, overlong texts: separate header + copy
+                    try:
+                        await context.bot.send_message(chat_id=target_id, text=header, parse_mode='HTML')
+                    except Exception:
+                        logger.exception("Support admin reply header send error")
+                    await context.bot.copy_message(chat_id=target_id, from_chat_id=msg.chat_id, message_id=msg.message_id, reply_markup=kb)
                 # Delivery confirmation for admin
                 try:
                     await msg.reply_text("✅ Сообщение доставлено пользователю.")
-                except Exception as e:
-                    print(f"Support admin confirmation error: {e}")
+                except Exception:
+                    logger.warning("Support admin confirmation error", exc_info=True)
             except Exception:
                 await msg.reply_text("❌ Не удалось отправить пользователю.")
         else:
@@ -206,7 +302,7 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
             return
     # User sends — route only after pressing «Поддержка» (первое сообщение) или «Ответить»
     uid = u.id if u else None
-    if uid and admin_id and (SUPPORT_REPLY_PENDING.pop(uid, None) == 'admin'):
+    if uid and admin_id and (_pop_pending(uid) == 'admin'):
         # Save user message to DB
         msg_text = msg.text or msg.caption or '<медиа>'
         await save_message_to_db(uid, msg_text, True)
@@ -218,19 +314,9 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
             deposits_cnt = 0
             deposits_sum = 0.0
             try:
-                import aiosqlite
-                from .main import DB_PATH  # type: ignore
-                async with aiosqlite.connect(DB_PATH, timeout=30) as db:
-                    cur = await db.execute("SELECT COUNT(*) FROM orders WHERE user_id=?", (uid,))
-                    row = await cur.fetchone()
-                    orders_cnt = (row[0] or 0) if row else 0
-                    cur = await db.execute("SELECT COUNT(*), IFNULL(SUM(expected_amount_usdt),0) FROM deposits WHERE user_id=?", (uid,))
-                    row = await cur.fetchone()
-                    if row:
-                        deposits_cnt = row[0] or 0
-                        deposits_sum = float(row[1] or 0)
-            except Exception as e:
-                print(f"Support user stats fetch error: {e}")
+                orders_cnt, deposits_cnt, deposits_sum = await _user_stats(uid)
+            except Exception:
+                logger.exception("Support user stats fetch error")
             info = (
                 f"📩 <b>Сообщение от пользователя</b>\n\n"
                 f"👤 {_user_title(u)}\n"
@@ -238,8 +324,8 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
                 f"🧾 Заказов: <b>{orders_cnt}</b> | 💳 Депозитов: <b>{deposits_cnt}</b> (<b>{deposits_sum:.2f} USDT</b>)"
             )
             await context.bot.send_message(chat_id=admin_id, text=info, parse_mode='HTML')
-        except Exception as e:
-            print(f"Support admin info send error: {e}")
+        except Exception:
+            logger.exception("Support admin info send error")
         sent_ok = False
         try:
             kb = InlineKeyboardMarkup([[InlineKeyboardButton("💬 Ответить", callback_data=f"support:reply:{uid}")]])
@@ -274,8 +360,8 @@ async def support_router(update: Update, context: ContextTypes.DEFAULT_TYPE, adm
                     "Пожалуйста, попробуйте позже.",
                     parse_mode='HTML'
                 )
-        except Exception as e:
-            print(f"Support user confirmation error: {e}")
+        except Exception:
+            logger.warning("Support user confirmation error", exc_info=True)
         return
     # Otherwise ignore and let other handlers process
 
@@ -289,6 +375,13 @@ def register_support_handlers(app: Application, admin_id: int) -> None:
     app.add_handler(CallbackQueryHandler(lambda u, c: support_on_callback(u, c, admin_id), pattern=r"^support:"))
     # Message router:
     #  - Users (non-admin): group 0 (before unknown_message), block others by default
-    app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND & ~filters.User(admin_id), lambda u, c: support_router(u, c, admin_id)), group=0)
+    # Filters are built once and shared; filters.ALL is dropped because MessageHandler
+    # already only sees updates with a message, so ~COMMAND alone is equivalent
+    admin_filter = filters.User(admin_id)
+    not_command = ~filters.COMMAND
+    app.add_handler(MessageHandler(not_command & ~admin_filter, lambda u, c: support_router(u, c, admin_id)), group=0)
     #  - Admin: group 2 (after unknown_message group 1), so admin flows process first
-    app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND & filters.User(admin_id), lambda u, c: support_router(u, c, admin_id)), group=2)
+    app.add_handler(MessageHandler(not_command & admin_filter, lambda u, c: support_router(u, c, admin_id)), group=2)
+    # Hourly sweep of expired one-shot reply states
+    if getattr(app, 'job_queue', None):
+        app.job_queue.run_repeating(_cleanup_pending, interval=3600, first=3600)
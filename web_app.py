@@ -1,14 +1,23 @@
 import os
 import sys
 import hmac
+import functools
+import collections
+import queue
+import re
 import hashlib
 import secrets
 import sqlite3
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Mapping, Optional, Tuple
 
-from flask import Flask, request, session, redirect, url_for, render_template_string, abort
+from flask import Flask, Response, g, request, session, redirect, url_for, abort
 from dotenv import load_dotenv
+from werkzeug.http import http_date
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, os.pardir))
@@ -24,8 +33,23 @@ BOT_LINK = os.getenv('WEB_BOT_LINK') or (f"https://t.me/{BOT_USERNAME}" if BOT_U
 DB_PATH = os.path.join(BASE_DIR, 'bot.db')
 R99_PRICE_RUB = float(os.getenv('R99_PRICE_RUB', '199'))
 RUB_USD_RATE = float(os.getenv('R99_RUB_USD_RATE', '100'))
+# Derived prices are fixed for the process lifetime
+_PRICE_RUB_INT = int(R99_PRICE_RUB)
+_PRICE_USD = round(R99_PRICE_RUB / RUB_USD_RATE, 2)
+_TARIFF_LABEL = f"VPN {_PRICE_RUB_INT}₽"
 R99_TXT = os.path.join(BASE_DIR, '99.txt')
 SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'change-me')
+# Telegram login widget: HMAC key is sha256(BOT_TOKEN)
+_BOT_SECRET = hashlib.sha256(BOT_TOKEN.encode()).digest() if BOT_TOKEN else b''
+_PUBLIC_ID_RETRIES = 3
+_STARTED_AT = http_date(time.time())  # Last-Modified for pages that only change on restart
+_AUTH_MAX_AGE = 86400  # seconds a Telegram login widget payload stays valid
+PROVISION_SCRIPT = os.path.join(BASE_DIR, 'provision_xray.py')
+# Background provisioning: a purchase returns immediately instead of holding a worker up to 600s
+# Deliberately not cancelled on exit: the balance is already debited, so the interpreter's exit hook
+# drains queued jobs and joins running ones (each bounded by the 600s provision timeout) before the
+# process stops; dropping them would leave paid orders without a server or a refund.
+_PROVISION_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('WEB_PROVISION_WORKERS', '4')), thread_name_prefix='provision')
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -33,12 +57,115 @@ app.secret_key = SECRET_KEY
 
 # --- Helpers ---
 
-def get_db() -> sqlite3.Connection:
+# Long-lived connections shared between requests (~2x the server's worker threads)
+DB_POOL_SIZE = int(os.getenv('WEB_DB_POOL_SIZE', '16'))
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+
+# Per-connection settings: bigger page cache, mmap'ed reads, in-memory temp tables
+DB_PRAGMAS = "PRAGMA synchronous=NORMAL; PRAGMA mmap_size=268435456; PRAGMA cache_size=-20000; PRAGMA temp_store=MEMORY;"
+# journal_mode=WAL is persisted in the DB file, so it is set once per process
+_wal_enabled = False
+
+
+def _new_conn() -> sqlite3.Connection:
+    global _wal_enabled
     conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    if not _wal_enabled:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    conn.executescript(DB_PRAGMAS)
     return conn
 
 
+@contextmanager
+def get_db():
+    """Borrow a pooled connection; commit on success, roll back on error (like sqlite3's own `with conn`)."""
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = _new_conn()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            _POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def _ensure_schema() -> None:
+    """Indexes the web routes rely on; the bot's init_db creates the tables."""
+    try:
+        with get_db() as db:
+            db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_public_id ON orders(public_id)")
+            # /orders and /profile: same definition as the bot's init_db (rowid id is implicit in the index)
+            db.execute("CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)")
+            # /order/<id> peers lookup (same definition as the bot's init_db)
+            db.execute("CREATE INDEX IF NOT EXISTS idx_peers_order ON peers(order_id)")
+    except sqlite3.Error:
+        app.logger.warning("Failed to ensure web_app indexes", exc_info=True)
+
+
+# Blocks whose whitespace is significant (or just left as authored) are not minified
+_VERBATIM_RE = re.compile(r'(<(style|pre|script|textarea)\b.*?</\2\s*>)', re.S | re.I)
+_WS_RE = re.compile(r'\s+')
+
+
+def _minify_html(source: str) -> str:
+    """Collapse whitespace runs to one space outside <style>/<pre>/<script>/<textarea>."""
+    parts = _VERBATIM_RE.split(source)
+    # split() yields [text, block, tagname, text, block, tagname, ...]
+    out = []
+    for i in range(0, len(parts), 3):
+        out.append(_WS_RE.sub(' ', parts[i]))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return ''.join(out).strip()
+
+
+@functools.lru_cache(maxsize=None)
+def _tpl(name: str):
+    """Minify and compile a *_TEMPLATE constant once; templates are defined at the bottom of the module."""
+    return app.jinja_env.from_string(_minify_html(globals()[name]))
+
+
+# Login page inputs never change after start; the body and its ETag are computed once
+# per host (the widget's auth URL is absolute). Bounded because Host comes from the client.
+_LOGIN_BODIES: Dict[str, Tuple[bytes, str]] = {}
+_LOGIN_BODIES_MAX = 8
+
+
+def _login_body() -> Tuple[bytes, str]:
+    key = request.host_url
+    cached = _LOGIN_BODIES.get(key)
+    if cached is None:
+        if BOT_USERNAME:
+            html = _tpl('LOGIN_TEMPLATE').render(
+                bot_username=BOT_USERNAME,
+                bot_link=BOT_LINK,
+                price_rub=_PRICE_RUB_INT,
+                price_usd=_PRICE_USD
+            )
+        else:
+            html = _tpl('TOKEN_LOGIN_TEMPLATE').render(
+                bot_link=BOT_LINK,
+                price_rub=_PRICE_RUB_INT,
+                price_usd=_PRICE_USD
+            )
+        body = html.encode('utf-8')
+        cached = (body, hashlib.sha1(body).hexdigest()[:16])
+        if len(_LOGIN_BODIES) >= _LOGIN_BODIES_MAX:
+            _LOGIN_BODIES.clear()
+        _LOGIN_BODIES[key] = cached
+    return cached
+
+
 def _gen_public_id(n: int = 8) -> str:
     alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
     return ''.join(secrets.choice(alphabet) for _ in range(n))
@@ -65,9 +192,20 @@ def _consume_token(token: str) -> Optional[int]:
         return int(row['user_id'])
 
 
+# Parsed 99.txt keyed by (mtime_ns, size); the file changes rarely
+_r99_cache: Dict[str, Any] = {"key": None, "val": None}
+
+
 def _read_r99_server() -> Optional[Dict[str, Any]]:
-    if not os.path.exists(R99_TXT):
+    try:
+        st = os.stat(R99_TXT)
+    except OSError:
+        _r99_cache["key"] = _r99_cache["val"] = None
         return None
+    key = (st.st_mtime_ns, st.st_size)
+    if key == _r99_cache["key"]:
+        return _r99_cache["val"]
+    val = None
     try:
         with open(R99_TXT, 'r', encoding='utf-8') as f:
             for line in f:
@@ -79,10 +217,12 @@ def _read_r99_server() -> Optional[Dict[str, Any]]:
                     continue
                 host, user, pwd = parts[0], parts[1], parts[2]
                 port = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else 22
-                return {'host': host, 'user': user, 'pwd': pwd, 'port': port}
+                val = {'host': host, 'user': user, 'pwd': pwd, 'port': port}
+                break
     except Exception:
         return None
-    return None
+    _r99_cache["key"], _r99_cache["val"] = key, val
+    return val
 
 
 def _get_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
@@ -103,32 +243,84 @@ def _get_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
         }
 
 
-def _verify_telegram_auth(data: Dict[str, Any]) -> bool:
+def _get_balance(db: sqlite3.Connection, user_id: int) -> float:
+    row = db.execute("SELECT IFNULL(balance, 0) FROM users WHERE user_id=?", (user_id,)).fetchone()
+    return float(row[0]) if row else 0.0
+
+
+def _verify_telegram_auth(data: Mapping[str, Any]) -> bool:
     if not BOT_TOKEN:
         return False
     received_hash = data.get('hash')
-    if not received_hash:
+    if not received_hash or 'id' not in data:
+        return False
+    # Reject stale or malformed payloads before doing any hashing
+    try:
+        auth_date = int(data.get('auth_date', '0'))
+    except (TypeError, ValueError):
         return False
-    pairs = []
-    for k in sorted(data.keys()):
-        if k == 'hash':
-            continue
-        pairs.append(f"{k}={data[k]}")
-    data_check_string = "\n".join(pairs)
-    secret_key = hashlib.sha256(BOT_TOKEN.encode()).digest()
-    hmac_hash = hmac.new(secret_key, msg=data_check_string.encode(), digestmod=hashlib.sha256).hexdigest()
-    return hmac.compare_digest(hmac_hash, received_hash)
+    if time.time() - auth_date > _AUTH_MAX_AGE:
+        return False
+    data_check = b"\n".join(f"{k}={data[k]}".encode('utf-8') for k in sorted(data) if k != 'hash')
+    expected = hmac.digest(_BOT_SECRET, data_check, 'sha256').hex()
+    return hmac.compare_digest(expected, received_hash)
 
 
 def login_required(func):
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         if 'tg_user' not in session:
             return redirect(url_for('index'))
         return func(*args, **kwargs)
-    wrapper.__name__ = func.__name__
     return wrapper
 
 
+# /orders rows as namedtuples: the template loop reads fields by attribute, not by Row name lookup
+_ORDER_ROW_COLUMNS = "id, public_id, country, config_count, months, status, price_usd, protocol, created_at"
+_OrderRow = collections.namedtuple('_OrderRow', _ORDER_ROW_COLUMNS)
+
+
+def _current_uid() -> int:
+    """Logged-in user's id, read from the session once per request."""
+    if 'uid' not in g:
+        g.uid = session['tg_user']['id']
+    return g.uid
+
+
+_ensure_schema()
+
+
+def _run_provision(order_id: int, price_usd: float, uid: int) -> None:
+    """Run provision_xray for an order; on failure refund and mark the order failed."""
+    rc = 0
+    err_text = ''
+    try:
+        res = subprocess.run(
+            [sys.executable, PROVISION_SCRIPT, '--order-id', str(order_id), '--db', DB_PATH],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=600
+        )
+        rc = res.returncode
+        if rc != 0:
+            err_text = (res.stderr or res.stdout or 'Unknown error')[-2000:]
+    except Exception as e:  # pragma: no cover
+        rc = 1
+        err_text = str(e)
+
+    if rc != 0:
+        app.logger.warning("Provision failed for order %s: %s", order_id, err_text[-500:])
+        try:
+            # Refund and status change in one write transaction on a pooled connection
+            with get_db() as db:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute("UPDATE users SET balance = IFNULL(balance,0) + ? WHERE user_id=?", (price_usd, uid))
+                db.execute("UPDATE orders SET status='failed', notes=? WHERE id=?", (f"Provision failed: {err_text[:500]}", order_id))
+        except Exception:
+            app.logger.exception("Failed to refund order %s", order_id)
+
+
 # --- Routes ---
 
 @app.route('/')
@@ -136,11 +328,10 @@ def index():
     if 'tg_user' not in session:
         return redirect(url_for('login'))
     user = session.get('tg_user')
-    return render_template_string(
-        HOME_TEMPLATE,
+    return _tpl('HOME_TEMPLATE').render(
         user=user,
-        price_rub=int(R99_PRICE_RUB),
-        price_usd=round(R99_PRICE_RUB / RUB_USD_RATE, 2)
+        price_rub=_PRICE_RUB_INT,
+        price_usd=_PRICE_USD
     )
 
 
@@ -148,26 +339,21 @@ def index():
 def login():
     if 'tg_user' in session:
         return redirect(url_for('home'))
-    if BOT_USERNAME:
-        return render_template_string(
-            LOGIN_TEMPLATE,
-            bot_username=BOT_USERNAME,
-            bot_link=BOT_LINK,
-            price_rub=int(R99_PRICE_RUB),
-            price_usd=round(R99_PRICE_RUB / RUB_USD_RATE, 2)
-        )
-    else:
-        return render_template_string(
-            TOKEN_LOGIN_TEMPLATE,
-            bot_link=BOT_LINK,
-            price_rub=int(R99_PRICE_RUB),
-            price_usd=round(R99_PRICE_RUB / RUB_USD_RATE, 2)
-        )
+    body, etag = _login_body()
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    # no-cache: the browser revalidates every time, so a logged-in user still gets the redirect
+    return Response(body, content_type='text/html; charset=utf-8', headers={
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'private, no-cache',
+        'Last-Modified': _STARTED_AT,
+    })
 
 
 @app.route('/auth/telegram')
 def auth_telegram():
-    data = dict(request.args)
+    # MultiDict is read directly (first value per key), no per-request dict copy
+    data = request.args
     if not data:
         abort(400)
     if not _verify_telegram_auth(data):
@@ -202,15 +388,14 @@ def auth_token():
 @app.route('/home')
 @login_required
 def home():
-    uid = session['tg_user']['id']
-    profile = _get_user_profile(uid) or {'balance': 0.0}
-    balance = profile.get('balance', 0.0)
-    return render_template_string(
-        DASHBOARD_TEMPLATE,
+    uid = _current_uid()
+    with get_db() as db:
+        balance = _get_balance(db, uid)
+    return _tpl('DASHBOARD_TEMPLATE').render(
         user=session['tg_user'],
         balance=balance,
-        price_rub=int(R99_PRICE_RUB),
-        price_usd=round(R99_PRICE_RUB / RUB_USD_RATE, 2)
+        price_rub=_PRICE_RUB_INT,
+        price_usd=_PRICE_USD
     )
 
 
@@ -224,122 +409,102 @@ def logout():
 @app.route('/orders')
 @login_required
 def orders():
-    uid = session['tg_user']['id']
-    profile = _get_user_profile(uid) or {'balance': 0.0}
+    uid = _current_uid()
     with get_db() as db:
+        balance = _get_balance(db, uid)
         cur = db.execute(
-            "SELECT id, public_id, country, config_count, months, status, price_usd, protocol, created_at FROM orders WHERE user_id=? ORDER BY id DESC LIMIT 50",
+            "SELECT " + _ORDER_ROW_COLUMNS + " FROM orders WHERE user_id=? ORDER BY id DESC LIMIT 50",
             (uid,)
         )
-        rows = cur.fetchall()
-    return render_template_string(ORDERS_TEMPLATE, user=session['tg_user'], balance=profile.get('balance', 0.0), orders=rows)
+        rows = [_OrderRow._make(r) for r in cur.fetchall()]
+    return _tpl('ORDERS_TEMPLATE').render(user=session['tg_user'], balance=balance, orders=rows)
 
 
 @app.route('/buy/r99', methods=['POST'])
 @login_required
 def buy_r99():
-    uid = session['tg_user']['id']
-    price_usd = round(R99_PRICE_RUB / RUB_USD_RATE, 2)
+    uid = _current_uid()
+    price_usd = _PRICE_USD
     server = _read_r99_server()
     if not server:
         return "Сервер недоступен (99.txt пустой)", 503
 
     with get_db() as db:
-        # Ensure user row exists
-        db.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (uid,))
-        cur = db.execute("SELECT balance FROM users WHERE user_id=?", (uid,))
-        balance = float(cur.fetchone()[0] or 0.0)
-        if balance < price_usd:
+        # One write transaction: check-and-deduct and the order insert commit together
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("INSERT INTO users (user_id, balance) VALUES (?, 0) ON CONFLICT(user_id) DO NOTHING", (uid,))
+        cur = db.execute(
+            "UPDATE users SET balance = IFNULL(balance,0) - ? WHERE user_id=? AND IFNULL(balance,0) >= ? RETURNING balance",
+            (price_usd, uid, price_usd)
+        )
+        if cur.fetchone() is None:
+            balance = float(db.execute("SELECT IFNULL(balance,0) FROM users WHERE user_id=?", (uid,)).fetchone()[0])
+            db.rollback()
             return f"Недостаточно средств. Нужно {price_usd} $, на балансе {balance} $", 400
 
-        # Deduct
-        db.execute("UPDATE users SET balance = IFNULL(balance,0) - ? WHERE user_id=?", (price_usd, uid))
-
-        # Insert order
-        public_id = _gen_public_id()
-        for _ in range(5):
-            cur = db.execute("SELECT 1 FROM orders WHERE public_id=?", (public_id,))
-            if not cur.fetchone():
+        # Insert order; public_id is UNIQUE, so a (rare) collision just regenerates it
+        for attempt in range(_PUBLIC_ID_RETRIES):
+            try:
+                cur = db.execute(
+                    """
+                    INSERT INTO orders (user_id, public_id, country, tariff_label, price_usd, months, discount, config_count, status, protocol, server_host, server_user, server_pass, ssh_port)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'provisioning', 'xray', ?, ?, ?, ?)
+                    RETURNING id
+                    """,
+                    (
+                        uid,
+                        _gen_public_id(),
+                        'R99',
+                        _TARIFF_LABEL,
+                        float(price_usd),
+                        1,
+                        0.0,
+                        1,
+                        server['host'],
+                        server['user'],
+                        server['pwd'],
+                        server['port']
+                    )
+                )
+                order_id = cur.fetchone()[0]
                 break
-            public_id = _gen_public_id()
-
-        cur = db.execute(
-            """
-            INSERT INTO orders (user_id, public_id, country, tariff_label, price_usd, months, discount, config_count, status, protocol, server_host, server_user, server_pass, ssh_port)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'provisioning', 'xray', ?, ?, ?, ?)
-            """,
-            (
-                uid,
-                public_id,
-                'R99',
-                f"VPN {int(R99_PRICE_RUB)}₽",
-                float(price_usd),
-                1,
-                0.0,
-                1,
-                server['host'],
-                server['user'],
-                server['pwd'],
-                server['port']
-            )
-        )
-        order_id = cur.lastrowid
+            except sqlite3.IntegrityError as e:
+                if 'public_id' not in str(e) or attempt == _PUBLIC_ID_RETRIES - 1:
+                    raise
         db.commit()
 
-    # Run provision synchronously
-    prov_path = os.path.join(BASE_DIR, 'provision_xray.py')
-    rc = 0
-    err_text = ''
-    try:
-        import subprocess
-        res = subprocess.run(
-            [sys.executable, prov_path, '--order-id', str(order_id), '--db', DB_PATH],
-            cwd=BASE_DIR,
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
-        rc = res.returncode
-        if rc != 0:
-            err_text = (res.stderr or res.stdout or 'Unknown error')[-2000:]
-    except Exception as e:  # pragma: no cover
-        rc = 1
-        err_text = str(e)
-
-    if rc != 0:
-        with get_db() as db:
-            db.execute("UPDATE users SET balance = IFNULL(balance,0) + ? WHERE user_id=?", (price_usd, uid))
-            db.execute("UPDATE orders SET status='failed', notes=? WHERE id=?", (f"Provision failed: {err_text[:500]}", order_id))
-            db.commit()
-        return f"Не удалось выдать конфиг (#{order_id}). Ошибка: {err_text}", 500
-
+    # Provisioning takes minutes: run it in the background, /orders shows the status
+    _PROVISION_POOL.submit(_run_provision, order_id, price_usd, uid)
     return redirect(url_for('orders'))
 
 
 @app.route('/protocols')
 @login_required
 def protocols():
-    uid = session['tg_user']['id']
-    profile = _get_user_profile(uid) or {'balance': 0.0}
-    return render_template_string(
-        PROTOCOLS_TEMPLATE,
+    uid = _current_uid()
+    with get_db() as db:
+        balance = _get_balance(db, uid)
+    return _tpl('PROTOCOLS_TEMPLATE').render(
         user=session['tg_user'],
-        balance=profile.get('balance', 0.0)
+        balance=balance
     )
 
 
 @app.route('/profile')
 @login_required
 def profile():
-    uid = session['tg_user']['id']
-    profile = _get_user_profile(uid) or {'balance': 0.0}
+    uid = _current_uid()
     with get_db() as db:
-        cur = db.execute("SELECT COUNT(*) FROM orders WHERE user_id=?", (uid,))
-        order_count = cur.fetchone()[0]
-    return render_template_string(
-        PROFILE_TEMPLATE,
+        # Balance and order count in one statement; the count is index-only
+        # over idx_orders_user(user_id), no table rows are read
+        cur = db.execute(
+            "SELECT (SELECT IFNULL(balance,0) FROM users WHERE user_id=?), (SELECT COUNT(*) FROM orders WHERE user_id=?)",
+            (uid, uid)
+        )
+        balance, order_count = cur.fetchone()
+    return _tpl('PROFILE_TEMPLATE').render(
         user=session['tg_user'],
-        balance=profile.get('balance', 0.0),
+        balance=float(balance or 0.0),
         order_count=order_count
     )
 
@@ -347,12 +512,12 @@ def profile():
 @app.route('/topup')
 @login_required
 def topup():
-    uid = session['tg_user']['id']
-    profile = _get_user_profile(uid) or {'balance': 0.0}
-    return render_template_string(
-        TOPUP_TEMPLATE,
+    uid = _current_uid()
+    with get_db() as db:
+        balance = _get_balance(db, uid)
+    return _tpl('TOPUP_TEMPLATE').render(
         user=session['tg_user'],
-        balance=profile.get('balance', 0.0),
+        balance=balance,
         bot_link=BOT_LINK
     )
 
@@ -360,12 +525,14 @@ def topup():
 @app.route('/order/<int:order_id>')
 @login_required
 def order_detail(order_id):
-    uid = session['tg_user']['id']
-    profile = _get_user_profile(uid) or {'balance': 0.0}
+    uid = _current_uid()
     with get_db() as db:
+        # Order and the user's balance in one statement
         cur = db.execute(
-            "SELECT id, public_id, country, config_count, months, status, price_usd, protocol, created_at, server_host FROM orders WHERE id=? AND user_id=?",
-            (order_id, uid)
+            "SELECT id, public_id, country, config_count, months, status, price_usd, protocol, created_at, server_host,"
+            " (SELECT IFNULL(balance,0) FROM users WHERE user_id=?) AS balance"
+            " FROM orders WHERE id=? AND user_id=?",
+            (uid, order_id, uid)
         )
         order = cur.fetchone()
         if not order:
@@ -375,10 +542,9 @@ def order_detail(order_id):
             (order_id,)
         )
         peers = cur.fetchall()
-    return render_template_string(
-        ORDER_DETAIL_TEMPLATE,
+    return _tpl('ORDER_DETAIL_TEMPLATE').render(
         user=session['tg_user'],
-        balance=profile.get('balance', 0.0),
+        balance=float(order['balance'] or 0.0),
         order=order,
         peers=peers
     )
@@ -533,19 +699,19 @@ ORDERS_TEMPLATE = """
     {% for o in orders %}
       <div class=\"order-card\">
         <div class=\"order-header\">
-          <div class=\"order-id\">#{{ o['id'] }} {{ o['public_id'] or '' }}</div>
-          <div class=\"status {{ o['status'] }}\">{{ o['status'] }}</div>
+          <div class=\"order-id\">#{{ o.id }} {{ o.public_id or '' }}</div>
+          <div class=\"status {{ o.status }}\">{{ o.status }}</div>
         </div>
         <div class=\"order-info\">
-          <div><strong>🌍 Страна</strong>{{ o['country'] }}</div>
-          <div><strong>🔐 Протокол</strong>{{ o['protocol'] }}</div>
-          <div><strong>📊 Конфигов</strong>{{ o['config_count'] }}</div>
-          <div><strong>📅 Месяцев</strong>{{ o['months'] }}</div>
-          <div><strong>💵 Цена</strong>{{ '%.2f' % o['price_usd'] }} $</div>
-          <div><strong>🕒 Создан</strong>{{ o['created_at'][:10] }}</div>
+          <div><strong>🌍 Страна</strong>{{ o.country }}</div>
+          <div><strong>🔐 Протокол</strong>{{ o.protocol }}</div>
+          <div><strong>📊 Конфигов</strong>{{ o.config_count }}</div>
+          <div><strong>📅 Месяцев</strong>{{ o.months }}</div>
+          <div><strong>💵 Цена</strong>{{ '%.2f' % o.price_usd }} $</div>
+          <div><strong>🕒 Создан</strong>{{ o.created_at[:10] }}</div>
         </div>
         <div style=\"margin-top: 12px;\">
-          <a href=\"{{ url_for('order_detail', order_id=o['id']) }}\" class=\"btn\">📝 Подробнее</a>
+          <a href=\"{{ url_for('order_detail', order_id=o.id) }}\" class=\"btn\">📝 Подробнее</a>
         </div>
       </div>
     {% else %}